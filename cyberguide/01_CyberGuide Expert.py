@@ -1,9 +1,13 @@
+import asyncio
 import ollama
 import streamlit as st
 import os
-from openai import OpenAI
+import time
+from openai import AsyncOpenAI
 from utilities.icon import page_icon
-from utilities.rag import retrieve_context
+from utilities.rag import MIN_RELEVANCE_SCORE, aretrieve_scored, start_warmup
+from utilities.retrieval.context_packing import pack_context, token_budget_for
+from utilities.retrieval.intent import is_small_talk
 
 st.set_page_config(
     page_title="CyberGuide",
@@ -11,6 +15,10 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
+# Load the embedding model and index the knowledge base in the background,
+# so the first chat only pays for a query instead of the whole warm-up.
+rag_service = start_warmup()
+
 # Custom CSS for enhanced aesthetics
 st.markdown("""
 <style>
@@ -80,6 +88,8 @@ def get_page_key(base_key):
 
 # Create page-specific messages key
 messages_key = get_page_key("messages")
+model_key = get_page_key("model")
+threshold_key = get_page_key("relevance_threshold")
 
 def extract_model_names(models_info) -> tuple:
     """
@@ -90,18 +100,107 @@ def extract_model_names(models_info) -> tuple:
 
     return tuple(model.model for model in models_info.models)
 
+def show_knowledge_base_status():
+    """
+    Shows whether the RAG knowledge base has finished warming up.
+    """
+    if rag_service.is_ready():
+        return
+
+    if rag_service.status == rag_service.FAILED:
+        st.error(f"Knowledge base failed to load: {rag_service.error}", icon="⛔️")
+    else:
+        st.info("Knowledge base is warming up — answers will not use retrieved context until it is ready.", icon="⏳")
+
+async def timed(timings, phase, awaitable):
+    """Awaits `awaitable` and records how long it took under timings[phase]."""
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[phase] = time.perf_counter() - started
+
+async def prepare_chat(prompt, model, min_score, timings):
+    """
+    Lists the local models and, when there is a prompt, retrieves context and loads the
+    selected model into Ollama at the same time.
+
+    Small talk skips retrieval entirely and returns None as the retrieval result.
+    A failed retrieval is returned as the exception, to be reported with the chat turn;
+    a failed warm-up is ignored, as the chat request itself reports the problem.
+    """
+    client = ollama.AsyncClient()
+    phases = [timed(timings, "models", client.list())]
+    retrieve = bool(prompt) and not is_small_talk(prompt)
+    if retrieve:
+        phases.append(timed(timings, "retrieval", aretrieve_scored(prompt, min_score=min_score)))
+    if prompt:
+        if model:
+            # An empty prompt makes Ollama load the model without generating anything
+            phases.append(timed(timings, "model_warmup", client.generate(model=model, prompt="")))
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*phases, return_exceptions=True)
+    timings["prepare"] = time.perf_counter() - started
+    if isinstance(results[0], Exception):
+        raise results[0]
+    return results[0], (results[1] if retrieve else None)
+
+async def stream_answer(client, model, messages, placeholder, timings):
+    """Streams the model's answer into placeholder and returns the full text."""
+    started = time.perf_counter()
+    stream = await client.chat.completions.create(model=model, messages=messages, stream=True)
+    response = ""
+    async for chunk in stream:
+        if "first_token" not in timings:
+            timings["first_token"] = time.perf_counter() - started
+        if chunk.choices and chunk.choices[0].delta.content:
+            response += chunk.choices[0].delta.content
+            placeholder.markdown(response + "▌")
+    placeholder.markdown(response)
+    timings["generation"] = time.perf_counter() - started
+    return response
+
+def log_timings(timings):
+    """Prints the per-phase timings of one chat turn and what running the setup phases concurrently saved."""
+    setup = [phase for phase in ("models", "retrieval", "model_warmup") if phase in timings]
+    parts = [f"{phase} {timings[phase] * 1000:.0f}ms" for phase in setup]
+    if "retrieval" not in timings:
+        parts.append("retrieval skipped")
+    saved = sum(timings[phase] for phase in setup) - timings["prepare"]
+    parts.append(f"concurrent setup {timings['prepare'] * 1000:.0f}ms (saved {saved * 1000:.0f}ms)")
+    parts += [f"{phase} {timings[phase] * 1000:.0f}ms" for phase in ("first_token", "generation") if phase in timings]
+    print(f" Expert chat timings: {', '.join(parts)}")
+
 def main():
     """
     The main function that runs the application.
     """
     
     st.subheader("Your Cyber Security Expert", divider="red", anchor=False)
+    show_knowledge_base_status()
 
-    client = OpenAI(
+    client = AsyncOpenAI(
         base_url="http://localhost:11434/v1",
         api_key="ollama",  # required, but unused
     )
 
+    # The chat input is pinned to the bottom of the page, so reading it first changes nothing
+    # on screen but lets retrieval and model loading start together with the model list
+    prompt = st.chat_input("Enter a prompt here...")
+    timings = {}
+    min_score = st.session_state.get(threshold_key, MIN_RELEVANCE_SCORE)
+    if prompt:
+        # Echo the question right away; the model list, retrieval and model loading can take seconds on a cold start
+        pending = st.empty()
+        with pending.container():
+            st.chat_message("user", avatar="😎").markdown(prompt)
+            with st.spinner("Searching the knowledge base and loading the model..."):
+                models_info, retrieval = asyncio.run(prepare_chat(prompt, st.session_state.get(model_key), min_score, timings))
+        pending.empty()
+    else:
+        models_info, retrieval = asyncio.run(prepare_chat(prompt, st.session_state.get(model_key), min_score, timings))
+
     # Model selection container
     st.markdown("""
     <div class="model-select-container">
@@ -114,15 +213,32 @@ def main():
     </div>
     """, unsafe_allow_html=True)
 
-    models_info = ollama.list()
     available_models = extract_model_names(models_info)
 
     if available_models:
         selected_model = st.selectbox(
             "Available Local Models", 
             available_models,
+            key=model_key,
             help="Choose from your locally available Ollama models"
         )
+        context_budget = st.slider(
+            "Context token budget",
+            min_value=128,
+            max_value=4096,
+            value=token_budget_for(selected_model),
+            step=64,
+            help="Approximate number of tokens of retrieved knowledge sent to the model. Smaller models answer faster with a smaller budget."
+        )
+        st.slider(
+            "Relevance threshold",
+            min_value=0.0,
+            max_value=1.0,
+            value=MIN_RELEVANCE_SCORE,
+            step=0.05,
+            key=threshold_key,
+            help="Retrieved knowledge is only sent to the model if its similarity to your question reaches this value."
+        )
     else:
         st.warning("You have not pulled any model from Ollama yet!", icon="⚠️")
         if st.button("Go to settings to download a model"):
@@ -140,48 +256,67 @@ def main():
         with message_container.chat_message(message["role"], avatar=avatar):
             st.markdown(message["content"])
 
-    if prompt := st.chat_input("Enter a prompt here..."):
+    if prompt:
         try:
             # Add user message to page-specific chat history
             st.session_state[messages_key].append({"role": "user", "content": prompt})
             message_container.chat_message("user", avatar="😎").markdown(prompt)
 
-            # 🔍 Retrieve relevant cybersecurity knowledge from RAG
-            most_relevant, retrieved_context = retrieve_context(prompt)
+            # 🔍 Relevant cybersecurity knowledge, retrieved while the model was loading
+            if isinstance(retrieval, Exception):
+                raise retrieval
+            retrieved_context = [text for text, _ in retrieval["chunks"]] if retrieval else []
+            packed = pack_context(retrieved_context, context_budget)
 
-            # 🌟 Show the most relevant retrieved chunk prominently
-            st.markdown(
-                f"""
-                <div class="retrieved-context">
-                    <h4>📌 Most Relevant Retrieved Information</h4>
-                    {most_relevant}
-                </div>
-                """, 
-                unsafe_allow_html=True
-            )
+            if retrieval is None:
+                # ⚡ Fast path: greetings and thanks need no knowledge base lookup
+                st.caption("⚡ Small talk — answered without searching the knowledge base.")
+            elif retrieval["below_threshold"]:
+                best_score = retrieval["best_score"]
+                best_match = f"best match {best_score:.2f}" if best_score is not None else "no matches"
+                st.caption(
+                    f"🔎 Nothing in the knowledge base is close enough to this question "
+                    f"({best_match}, threshold {min_score:.2f}), so no retrieved context was sent to the model."
+                )
+            elif retrieved_context:
+                # 🌟 Show the most relevant retrieved chunk prominently
+                st.markdown(
+                    f"""
+                    <div class="retrieved-context">
+                        <h4>📌 Most Relevant Retrieved Information</h4>
+                        {retrieved_context[0]}
+                    </div>
+                    """, 
+                    unsafe_allow_html=True
+                )
 
-            # 🔎 Debugging: Show full retrieved context in an expander
-            with st.expander("🔍 **All Retrieved Cybersecurity Context**", expanded=False):
-                st.info("\n\n".join(retrieved_context))
-
-            with message_container.chat_message("assistant", avatar="🤖"):
-                with st.spinner("model working..."):
-                    stream = client.chat.completions.create(
-                        model=selected_model,
-                        messages=[
-                            {
-                                "role": "system",
-                                "content": f"""                                 
-                                **Retrieved Knowledge:** {most_relevant}
-                                """,
-                            },
-                            {"role": "user", "content": prompt},  # ✅ User query is separate!
-                        ],
-                        stream=True,
+                # 🔎 Debugging: Show full retrieved context in an expander
+                with st.expander("🔍 **All Retrieved Cybersecurity Context**", expanded=False):
+                    st.info("\n\n".join(retrieved_context))
+                    st.caption(
+                        "Similarity: "
+                        + ", ".join("BM25 only" if score is None else f"{score:.2f}" for _, score in retrieval["chunks"])
+                    )
+                    st.caption(
+                        f"Prompt context: {len(packed['chunks'])} of {len(retrieved_context)} chunks, "
+                        f"~{packed['tokens_used']}/{packed['token_budget']} tokens, "
+                        f"{packed['duplicates_dropped']} duplicates dropped"
+                        + (", last chunk truncated" if packed["truncated"] else "")
                     )
 
+            with message_container.chat_message("assistant", avatar="🤖"):
+                messages = [{"role": "user", "content": prompt}]  # ✅ User query is separate!
+                if packed["chunks"]:
+                    messages.insert(0, {
+                        "role": "system",
+                        "content": f"""                                 
+                        **Retrieved Knowledge:** {packed["text"]}
+                        """,
+                    })
                 # Stream response and store it
-                response = st.write_stream(stream)
+                with st.spinner("model working..."):
+                    response = asyncio.run(stream_answer(client, selected_model, messages, st.empty(), timings))
+            log_timings(timings)
 
             # Add assistant response to page-specific chat history
             st.session_state[messages_key].append({"role": "assistant", "content": response})
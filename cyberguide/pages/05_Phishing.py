@@ -3,6 +3,8 @@ import ollama
 import re
 import time
 import os
+from utilities.rag import retrieve_context, start_warmup
+from utilities.retrieval.parsing import topic_filter
 
 # Get the current page name from the file name
 def get_current_page():
@@ -19,6 +21,9 @@ current_page = get_current_page()
 def get_page_key(base_key):
     return f"{current_page}_{base_key}"
 
+# Load the knowledge base in the background; feedback uses it once it is ready
+rag_service = start_warmup()
+
 # Create page-specific session keys
 messages_key = get_page_key("messages")
 question_number_key = get_page_key("question_number")
@@ -503,8 +508,15 @@ if user_input:
             # For visual effect, add a short delay
             #time.sleep(0.5)
             
+            # Ground the feedback in phishing-tagged scenarios and policy passages only, not the whole knowledge base
+            messages = st.session_state[messages_key]
+            if rag_service.is_ready():
+                _, guidance = retrieve_context(user_input, k=3, where=topic_filter("phishing"))
+                if guidance:
+                    messages = messages + [{"role": "system", "content": "Relevant phishing guidance: " + "\n\n".join(guidance)}]
+
             # Get response from LLM
-            response = ollama.chat(model="llava:latest", messages=st.session_state[messages_key])
+            response = ollama.chat(model="llava:latest", messages=messages)
             ai_message = response["message"]["content"]
             
             # Force the correct next question and include feedback
@@ -0,0 +1,63 @@
+import streamlit as st
+from utilities.rag import METRICS_ENABLED, start_warmup
+
+# Page configuration
+st.set_page_config(
+    page_title="Retrieval Metrics",
+    page_icon="📈",
+    layout="wide",
+    initial_sidebar_state="expanded",
+)
+
+rag_service = start_warmup()
+
+st.title("📈 Retrieval Metrics")
+st.caption("Latency and size of knowledge base lookups in this process, over the most recent requests.")
+
+if not METRICS_ENABLED:
+    st.info("Metrics are disabled. Start CyberGuide with `CYBERGUIDE_METRICS=1` to record them.")
+    st.stop()
+
+if st.button("Refresh"):
+    st.rerun()
+
+metrics = rag_service.metrics()
+registry = metrics["registry"]
+
+# Histograms: one row per metric, seconds shown as milliseconds
+rows = []
+for name, summary in registry["histograms"].items():
+    scale = 1000 if name.endswith("_seconds") else 1
+    label = name[:-len("_seconds")] + " (ms)" if scale == 1000 else name
+    rows.append({
+        "metric": label,
+        "count": summary["count"],
+        "p50": round(summary["p50"] * scale, 2),
+        "p95": round(summary["p95"] * scale, 2),
+        "p99": round(summary["p99"] * scale, 2),
+        "max": round(summary["max"] * scale, 2),
+    })
+
+if rows:
+    st.subheader("Timings and sizes")
+    st.dataframe(rows, use_container_width=True, hide_index=True)
+else:
+    st.write("No requests recorded yet.")
+
+col1, col2 = st.columns(2)
+with col1:
+    st.subheader("Counters")
+    st.json(registry["counters"])
+    st.subheader("Query cache")
+    st.json(metrics["query_cache"])
+with col2:
+    st.subheader("Query micro-batching")
+    st.json(metrics["query_batching"] or {})
+
+# Export the same data for Prometheus or other tooling
+rag_service.update_metric_gauges()
+col1, col2 = st.columns(2)
+with col1:
+    st.download_button("Download Prometheus text", rag_service.metrics_registry.to_prometheus(), file_name="cyberguide.prom")
+with col2:
+    st.download_button("Download JSON", rag_service.metrics_registry.to_json(), file_name="cyberguide_metrics.json")
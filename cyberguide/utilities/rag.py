@@ -1,146 +1,1144 @@
-import chromadb
-import fitz  # PyMuPDF
+import argparse
+import asyncio
+import hashlib
+import itertools
 import json
-from sentence_transformers import SentenceTransformer
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.document_loaders import PyMuPDFLoader
+import numpy as np
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from langchain.schema import Document
+from utilities.retrieval.dedup import MINHASH_VERSION, NearDuplicateIndex
+from utilities.retrieval.embedding_cache import CachedEmbeddings, EmbeddingCache
+from utilities.retrieval.embedding_server import DEFAULT_ADDRESS, EmbeddingServer, RemoteEmbeddings
+from utilities.retrieval.embeddings import EMBEDDING_BACKENDS, EMBEDDING_SCHEME, available_backends, create_embeddings
+from utilities.retrieval.lexical import BM25Index, reciprocal_rank_fusion
+from utilities.retrieval.manifest import IngestManifest, source_key
+from utilities.retrieval.metrics import MetricsRegistry, flatten_gauges
+from utilities.retrieval.micro_batching import MicroBatcher
+from utilities.retrieval.mmr import mmr
+from utilities.retrieval.parsing import (
+    SUPPORTED_EXTENSIONS,
+    is_scenario_file,
+    iter_chunks,
+    iter_pdf_pages,
+    parse_task,
+    plan_tasks,
+)
+from utilities.retrieval.query_cache import QueryCache, normalize_query
+from utilities.retrieval.shared_index import SharedIndex
+from utilities.retrieval.snapshot import export_snapshot, import_snapshot, load_snapshot_index, read_snapshot_manifest
+from utilities.retrieval.vector_backends import ChromaBackend, ids_signature
 
 
 
-DB_PATH = "./cybersecurity_db"
-embedding_model = HuggingFaceEmbeddings(model_name="all-mpnet-base-v2")
-vector_store = Chroma(persist_directory=DB_PATH, embedding_function=embedding_model)
-global text
+DB_PATH = os.environ.get("CYBERGUIDE_DB_PATH", "./cybersecurity_db")
+# Any sentence-transformers model; each model gets its own collection namespace
+EMBEDDING_MODEL_NAME = os.environ.get("CYBERGUIDE_EMBEDDING_MODEL", "all-mpnet-base-v2")
+# "torch", "torch-int8" or "onnx"; each backend gets its own collection namespace
+EMBEDDING_BACKEND = os.environ.get("CYBERGUIDE_EMBEDDING_BACKEND", "torch")
+# "unix:/path.sock" or "host:port" of a shared embedding server (python -m utilities.rag serve-embeddings);
+# unset loads the model in every process
+EMBEDDING_SERVER = os.environ.get("CYBERGUIDE_EMBEDDING_SERVER") or None
+SCENARIOS_PATH = "./CybersecurityScenarios.json"
+KNOWLEDGE_SOURCES = ["./Petra_logistics.pdf", SCENARIOS_PATH]
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 300
+# Scenarios are indexed as one unsplit record each; these fields additionally get records of
+# their own (any of "description", "tasks", "solution", "learning_objectives"), which search
+# resolves back to the whole scenario
+SCENARIO_FIELD_RECORDS = ()
+# Chunks embedded and written per store call; bounds ingest memory independent of file size
+INGEST_BATCH_SIZE = 64
+# PDF pages parsed per worker task by the ingest command
+PAGES_PER_TASK = 32
+MANIFEST_FILE = "ingest_manifest.json"
+LEXICAL_INDEX_FILE = "lexical_index.json"
+CHUNK_ID_SCHEME = "sha256(source, text)"
+# Bump when the metadata stored with chunks changes, so sources are rewritten with the new fields
+METADATA_SCHEME = 4
+# Kept outside DB_PATH so that rebuilding the vector store does not re-embed known text
+EMBEDDING_CACHE_PATH = "./embedding_cache.sqlite3"
+EMBEDDING_CACHE_MAX_ENTRIES = 200_000
+# "chroma", "numpy" or "auto": exact NumPy search while the collection has at most NUMPY_MAX_CHUNKS chunks
+VECTOR_BACKEND = os.environ.get("CYBERGUIDE_VECTOR_BACKEND", "auto")
+NUMPY_MAX_CHUNKS = 50_000
+# "float16" halves the memory-mapped matrix at a small cost in score precision
+NUMPY_DTYPE = os.environ.get("CYBERGUIDE_NUMPY_DTYPE", "float32")
+# Read-only workers attach to the index a writer process publishes under DB_PATH/numpy
+# instead of opening Chroma, and remap when a new version is published
+READ_ONLY = os.environ.get("CYBERGUIDE_READ_ONLY", "").lower() in ("1", "true", "yes")
+# How often a read-only worker checks for a newly published index version
+REMAP_CHECK_SECONDS = 2.0
+# A failed warm-up is retried by the next start_warmup() call once this long has passed
+WARMUP_RETRY_SECONDS = 30.0
+# Serve a read-only replica from this snapshot archive instead of the Chroma store
+SNAPSHOT_PATH = os.environ.get("CYBERGUIDE_SNAPSHOT") or None
+
+# Chunks whose MinHash-estimated shingle similarity to an earlier chunk of the same
+# source reaches this are not stored but linked to that chunk; None disables it
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+# Concurrent query embeddings are collected for up to this long, or this many queries, and
+# embedded in one forward pass; a wait of 0 embeds every call on its own
+QUERY_BATCH_MAX_WAIT_MS = 5.0
+QUERY_BATCH_MAX_SIZE = 32
+
+# Dense candidates fetched per query before MMR, and MMR's relevance/diversity trade-off
+MMR_FETCH_K = 20
+MMR_LAMBDA = 0.5
+
+# Retrieval and ingest timings go to rolling in-memory histograms only when enabled
+METRICS_ENABLED = os.environ.get("CYBERGUIDE_METRICS", "").lower() in ("1", "true", "yes")
+# If set, the registry is written here at most every METRICS_EXPORT_SECONDS; *.prom files get
+# Prometheus text format (e.g. for node_exporter's textfile collector), anything else JSON
+METRICS_PATH = os.environ.get("CYBERGUIDE_METRICS_PATH") or None
+METRICS_EXPORT_SECONDS = 10.0
+
+# Cosine similarity a query's best match must reach before retrieved context is used, when a
+# caller asks for gating (min_score); unrelated text scores around 0.1-0.2 with all-mpnet-base-v2
+MIN_RELEVANCE_SCORE = float(os.environ.get("CYBERGUIDE_MIN_RELEVANCE_SCORE", "0.35"))
+
+NOT_READY_MESSAGE = "The cybersecurity knowledge base is still loading, so no context was retrieved."
+NO_RESULTS_MESSAGE = "No relevant cybersecurity information found."
 
 
 def extract_text_from_pdf(pdf_path):
     """Extracts text from a given PDF file."""
-    text = ""
-    doc = fitz.open(pdf_path)
-    for page in doc:
-        text += page.get_text("text") + "\n"
-    return text
+    return "".join(text + "\n" for _, text in iter_pdf_pages(pdf_path))
 
-def index_data(file_path):
-    """Indexes both PDFs and JSON files into the vector store."""
-    global vector_store
 
-    documents = []
+def collection_namespace(model_name, backend):
+    """Chroma collection name for a model/backend pair, e.g. "all-mpnet-base-v2-torch".
+
+    Chroma allows 3-63 characters from [a-zA-Z0-9._-]; long model names are
+    shortened and made unique with a hash suffix.
+    """
+    name = re.sub(r"[^a-zA-Z0-9._-]+", "-", f"{model_name}-{backend}").strip("-._")
+    if len(name) > 63:
+        suffix = hashlib.sha256(name.encode("utf-8")).hexdigest()[:8]
+        name = f"{name[:54].rstrip('-._')}-{suffix}"
+    return name
+
+
+def add_timing(timings, phase, started):
+    """Adds the seconds since `started` to timings[phase] if timings are collected; returns now."""
+    now = time.perf_counter()
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0.0) + now - started
+    return now
+
+
+def iter_batches(items, batch_size):
+    """Groups an iterable into lists of at most batch_size items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_parsed(executor, tasks, window):
+    """Runs parse_task() over tasks in a process pool, yielding (task, result) in task order.
+
+    At most `window` tasks are in flight, so parsed chunks never pile up faster
+    than the single writer consumes them. A task that raised yields its
+    exception as the result, so one broken file does not end the run.
+    """
+    tasks = iter(tasks)
+    in_flight = deque()
+    for task in itertools.islice(tasks, window):
+        in_flight.append((task, executor.submit(parse_task, task, CHUNK_SIZE, CHUNK_OVERLAP, SCENARIO_FIELD_RECORDS)))
+
+    while in_flight:
+        task, future = in_flight.popleft()
+        next_task = next(tasks, None)
+        if next_task is not None:
+            in_flight.append((next_task, executor.submit(parse_task, next_task, CHUNK_SIZE, CHUNK_OVERLAP, SCENARIO_FIELD_RECORDS)))
+        try:
+            result = future.result()
+        except Exception as e:
+            result = e
+        yield task, result
+
+
+def reduction_ratio(removed, kept):
+    """Fraction of chunks removed out of all chunks seen."""
+    total = removed + kept
+    return removed / total if total else 0.0
+
+
+class IngestStats:
+    """Counters for one ingest run, reported as throughput when it ends."""
+
+    def __init__(self):
+        self.files = 0
+        self.skipped = 0
+        self.failed = 0
+        self.pages = 0
+        self.chunks = 0
+        self.near_duplicates = 0
+        self.new_chunks = 0
+        self.embed_seconds = 0.0
+        self.write_seconds = 0.0
+        self.started = time.perf_counter()
+
+    def record(self, registry):
+        """Adds this run's totals to a metrics registry."""
+        registry.observe("ingest_seconds", time.perf_counter() - self.started)
+        registry.observe("ingest_embed_seconds", self.embed_seconds)
+        registry.observe("ingest_write_seconds", self.write_seconds)
+        registry.observe("ingest_chunks", self.chunks)
+        registry.increment("ingest_chunks_embedded", self.new_chunks)
+        registry.increment("ingest_near_duplicates", self.near_duplicates)
+        registry.increment("ingest_pages", self.pages)
+
+    def report(self, embedding_cache):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        cache_stats = embedding_cache.stats()
+        print(f" Ingested {self.files} files ({self.skipped} unchanged, {self.failed} failed) in {elapsed:.1f}s")
+        print(f" {self.pages} pages ({self.pages / elapsed:.1f} pages/s), {self.chunks} chunks ({self.chunks / elapsed:.1f} chunks/s), {self.new_chunks} embedded and written")
+        print(f" Near-duplicates linked instead of stored: {self.near_duplicates} ({reduction_ratio(self.near_duplicates, self.chunks):.1%} fewer chunks)")
+        print(f" Embed time {self.embed_seconds:.1f}s, write time {self.write_seconds:.1f}s")
+        print(f" Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses ({cache_stats['entries']}/{cache_stats['max_entries']} entries)")
+
+
+class RAGService:
+    """
+    Owns the embedding model and the vector store for one process.
+
+    Nothing heavy happens in the constructor: torch, the embedding model and
+    Chroma are only loaded by warm_up(), which start_warmup() runs on a daemon
+    thread. retrieve_context() never loads or indexes anything itself; until the
+    service is ready it answers with NOT_READY_MESSAGE instead of blocking.
+    """
+
+    COLD = "cold"
+    WARMING = "warming"
+    READY = "ready"
+    FAILED = "failed"
+
+    def __init__(self, db_path=DB_PATH, model_name=EMBEDDING_MODEL_NAME, sources=None, backend=EMBEDDING_BACKEND, snapshot_path=SNAPSHOT_PATH, read_only=READ_ONLY):
+        self.db_path = db_path
+        self.model_name = model_name
+        self.backend = backend
+        self.collection_name = collection_namespace(model_name, backend)
+        self.sources = list(KNOWLEDGE_SOURCES if sources is None else sources)
+        # When set, warm_up() serves this snapshot and nothing is ingested
+        self.snapshot_path = snapshot_path
+        # When set, warm_up() attaches to the shared index published by a writer process
+        self.read_only = read_only
+        self.shared_index = SharedIndex(os.path.join(db_path, "numpy", self.collection_name))
+        self.shared_version = None
+        self._remap_checked = 0.0
+        self.embedding_model = None
+        self.vector_store = None
+        self.manifest = None
+        self.lexical_index = None
+        # ChromaBackend or NumpyBackend; attached by warm_up() once indexing is done
+        self.search_backend = None
+        # Bumped whenever ingestion changes the stored chunks; invalidates query_cache
+        self.index_version = 0
+        self.query_cache = QueryCache()
+        # Set together with the embedding model; shared by all threads that embed queries
+        self.query_batcher = None
+        # None unless metrics are enabled, so the hot path pays a single `is not None` check
+        self.metrics_registry = MetricsRegistry() if METRICS_ENABLED else None
+        self._metrics_exported = 0.0
+        self.status = RAGService.COLD
+        self.error = None
+        # Guards warm-up thread state only; _load() has its own lock so page runs never wait for the model
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+        self._failed_at = None
+
+    def start_warmup(self):
+        """Starts warm_up() on a background thread. Safe to call on every page run.
+
+        A failed warm-up is started again once WARMUP_RETRY_SECONDS have passed.
+        """
+        if self.status == RAGService.READY or (self.status == RAGService.WARMING and self._thread is not None):
+            return
+        with self._lock:
+            if self.status == RAGService.READY:
+                return
+            if self.status == RAGService.FAILED and time.monotonic() - self._failed_at >= WARMUP_RETRY_SECONDS:
+                self._thread = None
+            if self._thread is not None:
+                return
+            self.status = RAGService.WARMING
+            self._thread = threading.Thread(target=self._warmup_worker, name="rag-warmup", daemon=True)
+            self._thread.start()
+
+    def _warmup_worker(self):
+        try:
+            self.warm_up()
+        except Exception as e:
+            self.error = e
+            self._failed_at = time.monotonic()
+            self.status = RAGService.FAILED
+            print(f"⚠️ RAG warm-up failed: {e}")
+
+    def warm_up(self):
+        """Loads the model and store, indexes the knowledge sources and marks the service ready."""
+        self.status = RAGService.WARMING
+        if self.snapshot_path:
+            self._load_snapshot()
+        elif self.read_only:
+            self.embedding_model = self._create_embeddings()
+            self._wait_for_shared_index()
+            self._attach_shared_index()
+        else:
+            self._load()
+            for source in self.sources:
+                self.index_data(source)
+            self.compact_index()
+            self._attach_search_backend()
+
+        # Run one query so lazy initialisation in torch and the search backend is paid here
+        self.search(["phishing"], k=1)
+
+        self.status = RAGService.READY
+        self._ready.set()
+
+    def _load(self):
+        """Creates the embedding model and vector store once."""
+        with self._load_lock:
+            if self.vector_store is not None:
+                return
+            if self.snapshot_path:
+                raise RuntimeError(f"This service serves the read-only snapshot {self.snapshot_path} and has no vector store")
+            if self.read_only:
+                raise RuntimeError("This service is a read-only worker; ingest from a writer process")
+            # Imported here so that importing this module does not pull in torch
+            from langchain_community.vectorstores import Chroma
+
+            self.embedding_model = self._create_embeddings()
+            tags = {"embedding_model": self.model_name, "embedding_backend": self.backend}
+            self.vector_store = Chroma(
+                collection_name=self.collection_name,
+                persist_directory=self.db_path,
+                embedding_function=self.embedding_model,
+                collection_metadata=tags,
+            )
+            stored_tags = self.vector_store._collection.metadata or {}
+            if any(stored_tags.get(key) != value for key, value in tags.items()):
+                raise ValueError(f"Collection {self.collection_name} holds vectors from {stored_tags}, not {tags}")
+
+            self.manifest = IngestManifest(self._index_file(MANIFEST_FILE))
+            self.lexical_index = BM25Index.load(self._index_file(LEXICAL_INDEX_FILE))
+            if not len(self.lexical_index):
+                self._rebuild_lexical_index()
+
+    def _create_embeddings(self):
+        if EMBEDDING_SERVER:
+            embeddings = RemoteEmbeddings(EMBEDDING_SERVER, self.model_name, self.backend)
+        else:
+            embeddings = create_embeddings(self.model_name, self.backend)
+        embeddings = CachedEmbeddings(
+            embeddings,
+            EmbeddingCache(EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES),
+            model_name=f"{self.model_name}:{self.backend}:{EMBEDDING_SCHEME}",
+        )
+        if QUERY_BATCH_MAX_WAIT_MS:
+            self.query_batcher = MicroBatcher(embeddings.embed_queries, QUERY_BATCH_MAX_SIZE, QUERY_BATCH_MAX_WAIT_MS)
+        return embeddings
+
+    def _snapshot_dir(self):
+        return os.path.join(self.db_path, "snapshots", self.collection_name)
+
+    def _load_snapshot(self):
+        """Serves a snapshot: unpacks it if needed and memory-maps it. Only queries are ever embedded."""
+        started = time.perf_counter()
+        manifest = read_snapshot_manifest(self.snapshot_path)
+        stored = (manifest.get("embedding_model"), manifest.get("embedding_backend"))
+        if stored != (self.model_name, self.backend):
+            raise ValueError(f"Snapshot {self.snapshot_path} holds vectors from {stored}, not {(self.model_name, self.backend)}")
+
+        import_snapshot(self.snapshot_path, self._snapshot_dir())
+        self.search_backend, self.lexical_index = load_snapshot_index(self._snapshot_dir())
+        self.embedding_model = self._create_embeddings()
+        print(f" Loaded snapshot {self.snapshot_path} ({manifest['count']} chunks) in {time.perf_counter() - started:.1f}s")
+
+    def export_snapshot(self, path):
+        """Writes the collection, its BM25 index and float16 embeddings to a single snapshot archive."""
+        self._load()
+        data = self.vector_store.get(include=["embeddings", "documents", "metadatas"])
+        info = {
+            "embedding_model": self.model_name,
+            "embedding_backend": self.backend,
+            "collection": self.collection_name,
+            "chunk_id_scheme": CHUNK_ID_SCHEME,
+            "sources": {source: entry["content_hash"] for source, entry in self.manifest.sources.items()},
+        }
+        manifest = export_snapshot(
+            path, data["ids"], data["embeddings"], data["documents"], data["metadatas"], self.lexical_index, info
+        )
+        print(f" Wrote snapshot {path}: {manifest['count']} chunks, {manifest['dim']} dimensions, {os.path.getsize(path) / 2**20:.1f} MiB")
+        return manifest
+
+    def _attach_search_backend(self):
+        """Chooses the vector search backend, refreshing the NumPy mirror if the collection changed."""
+        chroma = ChromaBackend(self.vector_store._collection)
+        backend = VECTOR_BACKEND
+        if backend == "auto":
+            backend = "numpy" if chroma.count() <= NUMPY_MAX_CHUNKS else "chroma"
+
+        if backend == "chroma":
+            self.search_backend = chroma
+            return
+
+        # The manifest remembers what was published for the current store, so an unchanged start-up reads no ids
+        signature = self.manifest.published_signature()
+        if signature is None or self.shared_index.current_signature() != signature:
+            data = self.vector_store.get(include=["embeddings", "documents", "metadatas"])
+            version = self.shared_index.publish(
+                data["ids"], data["embeddings"], data["documents"], data["metadatas"], self.lexical_index, dtype=NUMPY_DTYPE
+            )
+            self.manifest.mark_published(ids_signature(data["ids"]))
+            print(f" Published {len(data['ids'])} vectors as shared index version {version}")
+        self.shared_version, self.search_backend, _ = self.shared_index.open()
+
+    def _wait_for_shared_index(self):
+        """Polls until a writer has published an index, so workers started before it become ready later."""
+        if self.shared_index.current_version() is not None:
+            return
+        print(f" Waiting for a writer to publish an index to {self.shared_index.root}")
+        while self.shared_index.current_version() is None:
+            time.sleep(REMAP_CHECK_SECONDS)
+
+    def _attach_shared_index(self):
+        """Maps the currently published index version, e.g. in read-only workers or after another process published."""
+        version, backend, lexical_index = self.shared_index.open()
+        self.search_backend, self.lexical_index = backend, lexical_index
+        if self.shared_version is not None:
+            print(f" Remapped shared index version {version}")
+        self.shared_version = version
+        self.index_version += 1
+
+    def _refresh_shared_index(self):
+        """Remaps the index at most every REMAP_CHECK_SECONDS if another process published a newer version.
+
+        Read-only workers and writers alike serve the shared index, so e.g. the
+        app picks up what `python -m utilities.rag ingest` published. A writer
+        also reloads its manifest, so its next ingest starts from that state.
+        """
+        now = time.monotonic()
+        if self.shared_version is None or now - self._remap_checked < REMAP_CHECK_SECONDS:
+            return
+        self._remap_checked = now
+        if self.shared_index.current_version() != self.shared_version:
+            self._attach_shared_index()
+            if self.manifest is not None:
+                self.manifest = IngestManifest(self._index_file(MANIFEST_FILE))
+
+    def _index_changed(self):
+        """Invalidates query caches and keeps an attached search backend in step with the store."""
+        self.index_version += 1
+        if self.search_backend is not None:
+            self._attach_search_backend()
+
+    def _index_file(self, name):
+        """Path of a side file (manifest, lexical index) that belongs to this service's collection."""
+        return os.path.join(self.db_path, f"{self.collection_name}_{name}")
+
+    def _rebuild_lexical_index(self):
+        """Builds the BM25 index from chunks already in the store, e.g. ones indexed before it existed."""
+        existing = self.vector_store.get(include=["documents"])
+        for chunk_id, text in zip(existing["ids"], existing["documents"]):
+            self.lexical_index.add(chunk_id, text)
+        if existing["ids"]:
+            self.lexical_index.save(self._index_file(LEXICAL_INDEX_FILE))
+
+    def compact_index(self):
+        """Deletes every stored chunk that no live source produces any more.
+
+        A source is live while its file exists; the manifest lists the chunk ids
+        each live source produced on its last ingest. Anything else in the store,
+        e.g. chunks of deleted files or chunks written with random ids before
+        chunk ids were content-derived, is garbage collected. Only ids are read,
+        and only if a source was ingested or removed since the last compaction.
+        """
+        self._load()
+
+        for source in list(self.manifest.sources):
+            # Entries under a non-canonical key were written before source paths were normalized
+            if source != source_key(source) or not os.path.exists(source):
+                self.manifest.remove(source)
+        if not self.manifest.needs_compaction():
+            return 0
+
+        live_ids = set()
+        for entry in self.manifest.sources.values():
+            live_ids.update(entry.get("chunk_ids", []))
+
+        dead_ids = [chunk_id for chunk_id in self.vector_store.get(include=[])["ids"] if chunk_id not in live_ids]
+        if dead_ids:
+            self.vector_store.delete(ids=dead_ids)
+            self.vector_store.persist()
+            self.lexical_index.remove(dead_ids)
+            self.lexical_index.save(self._index_file(LEXICAL_INDEX_FILE))
+        self.manifest.mark_compacted(store_changed=bool(dead_ids))
+        if dead_ids:
+            self._index_changed()
+            print(f" Compacted index: removed {len(dead_ids)} chunks no source produces any more")
+        return len(dead_ids)
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def metrics(self):
+        """Current query cache and query micro-batching statistics, plus the metrics registry if enabled."""
+        return {
+            "query_cache": self.query_cache.stats(),
+            "query_batching": self.query_batcher.stats() if self.query_batcher is not None else None,
+            "registry": self.metrics_registry.snapshot() if self.metrics_registry is not None else None,
+        }
+
+    def update_metric_gauges(self):
+        """Copies query cache, batching and index size stats into the registry's gauges."""
+        registry = self.metrics_registry
+        registry.gauges.update(flatten_gauges("query_cache", self.query_cache.stats()))
+        if self.query_batcher is not None:
+            registry.gauges.update(flatten_gauges("query_batching", self.query_batcher.stats()))
+        if self.search_backend is not None:
+            registry.set_gauge("index_chunks", self.search_backend.count())
+
+    def export_metrics(self, path=None):
+        """Writes the metrics registry with current gauges to path (default METRICS_PATH); returns the path."""
+        path = path or METRICS_PATH
+        if self.metrics_registry is None or not path:
+            return None
+        self.update_metric_gauges()
+        self.metrics_registry.write(path)
+        self._metrics_exported = time.monotonic()
+        return path
+
+    def _record_retrieval(self, timings, started, results, cache_hits):
+        """Records one retrieve_scored_batch() call in the metrics registry."""
+        registry = self.metrics_registry
+        registry.observe("retrieve_seconds", time.perf_counter() - started)
+        for phase, seconds in timings.items():
+            registry.observe(f"retrieve_{phase}_seconds", seconds)
+        for result in results:
+            registry.observe("retrieve_chunks", len(result["chunks"]))
+            registry.observe("retrieve_bytes", sum(len(text.encode("utf-8")) for text, _ in result["chunks"]))
+            if result["best_score"] is not None:
+                registry.observe("retrieve_best_score", result["best_score"])
+        registry.increment("retrieve_queries", len(results))
+        registry.increment("retrieve_cache_hits", cache_hits)
+        registry.increment("retrieve_below_threshold", sum(result["below_threshold"] for result in results))
+        if METRICS_PATH and time.monotonic() - self._metrics_exported >= METRICS_EXPORT_SECONDS:
+            self.export_metrics()
+
+    def wait_until_ready(self, timeout=None):
+        """Blocks until warm-up has finished. Returns True if the service is ready."""
+        return self._ready.wait(timeout)
 
-    if file_path.endswith(".pdf"):
-        doc = fitz.open(file_path)
-        text = "\n".join([page.get_text("text") for page in doc])
-        documents.append(Document(page_content=text, metadata={"source": file_path}))
+    def _ingest_settings(self):
+        """Everything besides the file content that determines the stored chunks."""
+        return {
+            "chunk_size": CHUNK_SIZE,
+            "chunk_overlap": CHUNK_OVERLAP,
+            "pdf_split": "per-page",
+            "scenario_records": ["scenario", *SCENARIO_FIELD_RECORDS],
+            "embedding_model": self.model_name,
+            "embedding_backend": self.backend,
+            "embedding_scheme": EMBEDDING_SCHEME,
+            "chunk_id_scheme": CHUNK_ID_SCHEME,
+            "near_duplicate_threshold": NEAR_DUPLICATE_THRESHOLD,
+            "minhash_version": MINHASH_VERSION,
+            "metadata_scheme": METADATA_SCHEME,
+        }
 
-    elif file_path.endswith(".json"):
-        with open(file_path, "r", encoding="utf-8") as f:
-            json_data = json.load(f)
+    def _is_current(self, file_path):
+        """Checks the manifest for a source. Returns (is current, fingerprint, settings)."""
+        fingerprint = self.manifest.fingerprint(file_path)
+        settings = self._ingest_settings()
+        if self.manifest.is_current(file_path, fingerprint, settings):
+            self.manifest.touch(file_path, fingerprint)
+            return True, fingerprint, settings
+        return False, fingerprint, settings
 
-        if "scenarios" in json_data and isinstance(json_data["scenarios"], list):
-            for scenario in json_data["scenarios"]:
-                title = scenario.get("title", "No Title")
-                description = scenario.get("description", "")
-                tasks = " ".join(scenario.get("tasks", []))
-                solution = scenario.get("solution", "")
-                learning_objectives = " ".join(scenario.get("learning_objectives", []))
+    def _write_source(self, file_path, fingerprint, settings, chunks, stats):
+        """Embeds and upserts a source's chunks in batches, then deletes the ones it no longer produces.
 
-                combined_text = f"Scenario: {title}\n\nDescription: {description}\n\nTasks: {tasks}\n\nSolution: {solution}\n\nLearning Objectives: {learning_objectives}"
-                
-                documents.append(Document(page_content=combined_text, metadata={"source": file_path}))
+        `chunks` is an iterable of (chunk id, chunk) pairs and is consumed lazily,
+        INGEST_BATCH_SIZE chunks at a time. Near-duplicates of an earlier chunk of
+        the same source are neither embedded nor stored; the manifest links each
+        one to its canonical chunk under "duplicates". Unchanged chunks whose
+        position moved, e.g. to another page, only get their metadata updated.
+        """
+        previous = self.manifest.get(file_path) or {}
+        if "chunk_ids" in previous:
+            previous_ids = set(previous["chunk_ids"])
+        else:
+            previous_ids = set(self.vector_store.get(where={"source": file_path}, include=[])["ids"])
+        # Unchanged chunks are skipped only if they were stored with the same settings, and so the same
+        # metadata; otherwise they are upserted again, their embeddings coming from the embedding cache
+        unchanged_ids = previous_ids if previous.get("settings") == settings else set()
 
-    else:
-        print(f"⚠️ Unsupported file type: {file_path}")
-        return
+        chunk_ids = []
+        seen_ids = set()
+        duplicates = {}
+        near_duplicates = NearDuplicateIndex(NEAR_DUPLICATE_THRESHOLD) if NEAR_DUPLICATE_THRESHOLD else None
+        new_count = 0
+        updated_count = 0
+        for batch in iter_batches(chunks, INGEST_BATCH_SIZE):
+            new_chunks = {}
+            kept_chunks = {}
+            for chunk_id, chunk in batch:
+                if chunk_id in seen_ids or chunk_id in duplicates:
+                    continue  # identical text twice in one source is stored once
+                if near_duplicates is not None:
+                    canonical_id = near_duplicates.canonical(chunk_id, chunk.page_content)
+                    if canonical_id is not None:
+                        duplicates[chunk_id] = canonical_id
+                        continue
+                seen_ids.add(chunk_id)
+                chunk_ids.append(chunk_id)
+                if chunk_id not in unchanged_ids:
+                    new_chunks[chunk_id] = chunk
+                else:
+                    kept_chunks[chunk_id] = chunk
 
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=300)
-    docs = text_splitter.split_documents(documents)
+            if kept_chunks:
+                # Ids hash only source and text, so page, chunk_index or scenario_id may have moved
+                stored = self.vector_store._collection.get(ids=list(kept_chunks), include=["metadatas"])
+                moved = [
+                    chunk_id for chunk_id, metadata in zip(stored["ids"], stored["metadatas"])
+                    if metadata != kept_chunks[chunk_id].metadata
+                ]
+                if moved:
+                    self.vector_store._collection.update(
+                        ids=moved, metadatas=[kept_chunks[chunk_id].metadata for chunk_id in moved]
+                    )
+                    updated_count += len(moved)
 
-    existing_metadatas = vector_store.get()["metadatas"]
-    existing_ids = set(m["source"] for m in existing_metadatas if "source" in m)
+            if new_chunks:
+                texts = [chunk.page_content for chunk in new_chunks.values()]
+                started = time.perf_counter()
+                embeddings = self.embedding_model.embed_documents(texts)
+                stats.embed_seconds += time.perf_counter() - started
 
-    new_data = []
-    for i, doc in enumerate(docs):
-        doc_id = f"{file_path}_{i}"  
+                started = time.perf_counter()
+                self.vector_store._collection.upsert(
+                    ids=list(new_chunks),
+                    embeddings=embeddings,
+                    documents=texts,
+                    metadatas=[chunk.metadata for chunk in new_chunks.values()],
+                )
+                # Tokenize chunks here, once, so queries only ever tokenize themselves
+                for chunk_id, text in zip(new_chunks, texts):
+                    self.lexical_index.add(chunk_id, text)
+                stats.write_seconds += time.perf_counter() - started
+                new_count += len(new_chunks)
 
-        if doc_id not in existing_ids:   
-            doc.metadata["source"] = doc_id
-            new_data.append(doc)
+        stale_ids = list(previous_ids.difference(seen_ids))
+        if stale_ids:
+            self.vector_store.delete(ids=stale_ids)
+            self.lexical_index.remove(stale_ids)
+        if new_count or updated_count or stale_ids:
+            self.vector_store.persist()
+            self.lexical_index.save(self._index_file(LEXICAL_INDEX_FILE))
+            self._index_changed()
 
-    if new_data:
-        vector_store.add_documents(new_data)
-        vector_store.persist()
-        print(f" Indexed {len(new_data)} new chunks from {file_path}")
-    else:
-        print(f" Skipped indexing for {file_path}, as all chunks already exist.")
+        self.manifest.record(file_path, fingerprint, settings, chunk_ids=chunk_ids, duplicates=duplicates)
+        stats.files += 1
+        stats.chunks += len(chunk_ids)
+        stats.near_duplicates += len(duplicates)
+        stats.new_chunks += new_count
+        print(
+            f" Indexed {file_path}: {new_count} new, {len(chunk_ids) - new_count} unchanged "
+            f"({updated_count} with updated metadata), {len(stale_ids)} removed chunks"
+        )
+        if duplicates:
+            print(f" Linked {len(duplicates)} near-duplicate chunks to canonical ones ({reduction_ratio(len(duplicates), len(chunk_ids)):.1%} fewer chunks)")
 
+    def index_data(self, file_path):
+        """Indexes both PDFs and JSON files into the vector store.
 
+        Sources whose content hash and ingest settings match the manifest are
+        skipped before any parsing. A changed source upserts chunks under
+        content-derived ids, so unchanged chunks keep their id and are not
+        re-embedded, and chunks the new version no longer produces are deleted.
 
+        Ingestion streams page -> split -> embed -> write in batches of
+        INGEST_BATCH_SIZE chunks, so memory stays flat regardless of file size.
+        """
+        self._load()
+        file_path = source_key(file_path)
 
+        if not file_path.endswith(SUPPORTED_EXTENSIONS):
+            print(f"⚠️ Unsupported file type: {file_path}")
+            return
+        if file_path.endswith(".json") and not is_scenario_file(file_path):
+            print(f"⚠️ Skipped {file_path}: not a scenario file")
+            return
 
-# def retrieve_context(query, k=5):
-#     """Retrieves relevant chunks using LangChain's retriever and filters results."""
-#     global vector_store
+        is_current, fingerprint, settings = self._is_current(file_path)
+        if is_current:
+            print(f" Skipped indexing for {file_path}, as it is unchanged since the last ingest.")
+            return
 
-#     retriever = vector_store.as_retriever(
-#         search_type="mmr",
-#         search_kwargs={"k": k, "fetch_k": 10}
-#     )
+        stats = IngestStats()
+        self.embedding_model.cache.reset_counters()
+        chunks = iter_chunks(file_path, CHUNK_SIZE, CHUNK_OVERLAP, field_records=SCENARIO_FIELD_RECORDS)
+        self._write_source(file_path, fingerprint, settings, chunks, stats)
+        if self.metrics_registry is not None:
+            stats.record(self.metrics_registry)
+        cache_stats = self.embedding_model.cache.stats()
+        print(f" Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses ({cache_stats['entries']}/{cache_stats['max_entries']} entries)")
 
-#     docs = retriever.get_relevant_documents(query)
+    def ingest_directory(self, directory, workers=None, pages_per_task=PAGES_PER_TASK):
+        """Indexes every PDF and JSON file under a directory.
 
-#     if not docs:
-#         return "No relevant cybersecurity information found."
+        Parsing and splitting run in a process pool, a page range per task;
+        embedding and store writes stay in this process and go through the same
+        batched writer as index_data(). Unchanged files are skipped via the
+        manifest, and chunks of deleted files are compacted away, so re-running
+        is safe and cheap.
+        """
+        self._load()
+        stats = IngestStats()
+        self.embedding_model.cache.reset_counters()
 
-#     # Filter chunks: Keep only those containing the most keywords from the query
-#     query_words = set(query.lower().split())  # Convert query to set of words
-#     filtered_docs = []
-    
-#     for doc in docs:
-#         chunk_words = set(doc.page_content.lower().split())
-#         match_count = len(query_words.intersection(chunk_words))  # Count word matches
-        
-#         # Keep only chunks that share at least 30% of words with the query
-#         if match_count / len(query_words) >= 0.3:
-#             filtered_docs.append(doc.page_content)
+        db_dir = os.path.abspath(self.db_path)
+        sources = []
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = sorted(
+                d for d in dirs
+                if not d.startswith(".") and os.path.abspath(os.path.join(root, d)) != db_dir
+            )
+            sources.extend(source_key(os.path.join(root, name)) for name in sorted(files) if name.endswith(SUPPORTED_EXTENSIONS))
 
-#     if filtered_docs:
-#         return "\n".join(filtered_docs)
-    
-#     return "No highly relevant cybersecurity information found."
+        pending = {}
+        for source in sources:
+            try:
+                is_current, fingerprint, settings = self._is_current(source)
+            except OSError as e:
+                stats.failed += 1
+                print(f"⚠️ Failed to ingest {source}: {e}")
+                continue
+            if is_current:
+                stats.skipped += 1
+            elif source.endswith(".json") and not is_scenario_file(source):
+                # e.g. benchmark results or tokenizer configs; never recorded, so they are checked again next time
+                print(f" Skipped {source}: not a scenario file")
+            else:
+                pending[source] = (fingerprint, settings)
 
-def retrieve_context(query, k=5):
-    """Retrieves relevant chunks using LangChain's retriever and filters results."""
-    global vector_store
+        if pending:
+            workers = workers or os.cpu_count() or 1
+            plans = {}
+            for source in list(pending):
+                try:
+                    plans[source] = plan_tasks(source, pages_per_task)
+                except Exception as e:
+                    stats.failed += 1
+                    del pending[source]
+                    print(f"⚠️ Failed to ingest {source}: {e}")
+            tasks = (task for source in plans for task in plans[source])
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                parsed = iter_parsed(executor, tasks, window=2 * workers)
+                for source, results in itertools.groupby(parsed, key=lambda item: item[0][0]):
+                    fingerprint, settings = pending[source]
+                    try:
+                        self._write_source(source, fingerprint, settings, self._parsed_chunks(results, stats), stats)
+                    except Exception as e:
+                        # The source is not recorded, so it is retried next run; chunks it wrote get compacted away
+                        stats.failed += 1
+                        self.manifest.mark_changed()
+                        print(f"⚠️ Failed to ingest {source}: {e}")
 
-    retriever = vector_store.as_retriever(
-        search_type="mmr",
-        search_kwargs={"k": k, "fetch_k": 10}
+        self.compact_index()
+        # Publish the result so read-only workers remap to it
+        self._attach_search_backend()
+        if self.metrics_registry is not None:
+            stats.record(self.metrics_registry)
+            self.export_metrics()
+        stats.report(self.embedding_model.cache)
+        return stats
+
+    @staticmethod
+    def _parsed_chunks(results, stats):
+        """Rebuilds (chunk id, chunk) pairs from worker results, counting parsed pages. Re-raises worker errors."""
+        for _, result in results:
+            if isinstance(result, Exception):
+                raise result
+            pages, chunks = result
+            stats.pages += pages
+            for chunk_id, text, metadata in chunks:
+                yield chunk_id, Document(page_content=text, metadata=metadata)
+
+    def dense_search_ids(self, embeddings, k):
+        """Ids of the k nearest chunks for each query vector, nearest first. Used by benchmarks."""
+        return [[hit["id"] for hit in hits] for hits in self.search_backend.query(embeddings, k)]
+
+    def _embed_queries(self, queries):
+        """Embeds normalized queries in one batch, reusing embeddings of earlier identical queries."""
+        embeddings = [self.query_cache.embeddings.get(query) for query in queries]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+
+        if missing:
+            embed = self.query_batcher.embed if self.query_batcher is not None else self.embedding_model.embed_queries
+            computed = embed([queries[i] for i in missing])
+            for i, embedding in zip(missing, computed):
+                embeddings[i] = embedding
+                self.query_cache.embeddings.put(queries[i], embedding)
+
+        return embeddings
+
+    def _mmr_search(self, embeddings, k, fetch_k, lambda_mult, timings=None, where=None):
+        """Fetches candidates for all query vectors in one backend round-trip, then applies MMR per query.
+
+        The candidates' stored embeddings come back with them, so MMR never
+        triggers another embedding call. Returns one list of (chunk id, text,
+        cosine similarity) triples per query vector.
+        """
+        started = time.perf_counter()
+        candidates = self.search_backend.query(embeddings, fetch_k, where=where)
+        started = add_timing(timings, "search", started)
+
+        results = []
+        for embedding, hits in zip(embeddings, candidates):
+            if not hits:
+                results.append([])
+                continue
+            selected = mmr(
+                embedding,
+                np.stack([np.asarray(hit["embedding"], dtype=np.float32) for hit in hits]),
+                k=k,
+                lambda_mult=lambda_mult,
+                query_scores=[hit["score"] for hit in hits],
+            )
+            results.append([(hits[j]["id"], hits[j]["text"], hits[j]["score"]) for j in selected])
+        add_timing(timings, "mmr", started)
+        return results
+
+    def _hybrid_search(self, normalized_queries, embeddings, k, fetch_k, lambda_mult, timings=None, where=None):
+        """Fuses the dense MMR ranking with the BM25 ranking of each query by reciprocal rank fusion.
+
+        Chunks only BM25 found are fetched from the store in one call for all queries.
+        Returns one list of (chunk id, text, score) triples per query, best first.
+        The score is the chunk's cosine similarity to the query, or None for
+        chunks only BM25 found.
+        """
+        dense_results = self._mmr_search(embeddings, k, fetch_k, lambda_mult, timings, where)
+
+        started = time.perf_counter()
+        allowed = set(self.search_backend.ids_matching(where)) if where else None
+        lexical_results = [self.lexical_index.search(query, top_n=k, allowed=allowed) for query in normalized_queries]
+        started = add_timing(timings, "lexical", started)
+
+        texts = {}
+        fused_rankings = []
+        scores = []  # per query: chunk id -> cosine similarity, for the chunks the dense search returned
+        for dense, lexical in zip(dense_results, lexical_results):
+            texts.update((chunk_id, text) for chunk_id, text, _ in dense)
+            scores.append({chunk_id: score for chunk_id, _, score in dense})
+            fused_rankings.append(reciprocal_rank_fusion([
+                [chunk_id for chunk_id, _, _ in dense],
+                [chunk_id for chunk_id, _ in lexical],
+            ]))
+
+        # Scenario field records stand in for their whole scenario, which is returned once in their place
+        # and scores as its best matching field
+        if SCENARIO_FIELD_RECORDS:
+            parents = self.search_backend.parent_ids({chunk_id for ranking in fused_rankings for chunk_id in ranking})
+            fused_rankings = [list(dict.fromkeys(parents.get(chunk_id, chunk_id) for chunk_id in ranking)) for ranking in fused_rankings]
+            for query_scores in scores:
+                for chunk_id, score in list(query_scores.items()):
+                    parent = parents.get(chunk_id, chunk_id)
+                    query_scores[parent] = max(score, query_scores.get(parent, score))
+        fused_rankings = [ranking[:k] for ranking in fused_rankings]
+
+        missing = list({chunk_id for ranking in fused_rankings for chunk_id in ranking if chunk_id not in texts})
+        if missing:
+            texts.update(self.search_backend.get_texts(missing))
+
+        results = [
+            [(chunk_id, texts[chunk_id], query_scores.get(chunk_id)) for chunk_id in ranking if chunk_id in texts]
+            for ranking, query_scores in zip(fused_rankings, scores)
+        ]
+        add_timing(timings, "rerank", started)
+        return results
+
+    def search(self, queries, k=5, fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA, timings=None, where=None):
+        """Hybrid dense + BM25 search that bypasses the result cache.
+
+        Returns one list of (chunk id, text, score) triples per query, best
+        first; the score is the cosine similarity to the query, or None for
+        chunks only BM25 found. If a
+        `timings` dict is passed, the seconds spent in query embedding, vector
+        search, BM25 search, MMR and fusion re-ranking are added to its "embed",
+        "search", "lexical", "mmr" and "rerank" entries. `where` restricts both searches to chunks
+        whose metadata equals every given value, e.g. topic_filter("phishing").
+        """
+        normalized_queries = [normalize_query(query) for query in queries]
+        started = time.perf_counter()
+        embeddings = self._embed_queries(normalized_queries)
+        add_timing(timings, "embed", started)
+        return self._hybrid_search(normalized_queries, embeddings, k, fetch_k, lambda_mult, timings, where)
+
+    def retrieve_scored_batch(self, queries, k=5, fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA, where=None, min_score=None):
+        """Retrieves ranked chunks with their similarity scores for many queries, in input order.
+
+        Uncached queries are embedded in a single batched forward pass and
+        searched with a single store query. Each result is a dict with
+        "chunks" (text, score) pairs best first, where the score is the cosine
+        similarity to the query or None for chunks only BM25 found, and
+        "best_score", the highest similarity of any chunk.
+
+        With `min_score`, a query whose best score stays below it gets no
+        chunks at all and "below_threshold" set, and scored chunks below it are
+        dropped from the others; BM25-only chunks are kept when the query passes.
+        """
+        if not self.is_ready():
+            return [{"chunks": [], "best_score": None, "below_threshold": False} for _ in queries]
+
+        started = time.perf_counter()
+        timings = {} if self.metrics_registry is not None else None
+        self._refresh_shared_index()
+        self.query_cache.sync(self.index_version)
+        normalized_queries = [normalize_query(query) for query in queries]
+        filter_key = tuple(sorted(where.items())) if where else None
+        results = [None] * len(queries)
+        pending = {}  # normalized query -> positions in the input, so duplicates are searched once
+
+        for i, normalized_query in enumerate(normalized_queries):
+            cached = self.query_cache.results.get((normalized_query, k, fetch_k, lambda_mult, filter_key))
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.setdefault(normalized_query, []).append(i)
+
+        if pending:
+            pending_queries = list(pending)
+            hits_per_query = self.search(pending_queries, k, fetch_k, lambda_mult, timings=timings, where=where)
+            for normalized_query, hits in zip(pending_queries, hits_per_query):
+                result = tuple((text, score) for _, text, score in hits)
+                self.query_cache.results.put((normalized_query, k, fetch_k, lambda_mult, filter_key), result)
+                for i in pending[normalized_query]:
+                    results[i] = result
+
+        results = [self._score_result(chunks, min_score) for chunks in results]
+        if timings is not None:
+            self._record_retrieval(timings, started, results, len(queries) - sum(len(positions) for positions in pending.values()))
+        return results
+
+    @staticmethod
+    def _score_result(chunks, min_score):
+        scores = [score for _, score in chunks if score is not None]
+        best_score = max(scores) if scores else None
+        if min_score is None:
+            return {"chunks": list(chunks), "best_score": best_score, "below_threshold": False}
+        if best_score is None or best_score < min_score:
+            return {"chunks": [], "best_score": best_score, "below_threshold": True}
+        kept = [(text, score) for text, score in chunks if score is None or score >= min_score]
+        return {"chunks": kept, "best_score": best_score, "below_threshold": False}
+
+    def retrieve_context_batch(self, queries, k=5, fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA, where=None, min_score=None):
+        """Retrieves context for many queries at once, returning results in input order.
+
+        Each result has the same (most relevant chunk, ranked chunks) shape as
+        retrieve_context(); see retrieve_scored_batch() for the scores.
+        """
+        if not self.is_ready():
+            return [(NOT_READY_MESSAGE, []) for _ in queries]
+        results = []
+        for result in self.retrieve_scored_batch(queries, k, fetch_k, lambda_mult, where, min_score):
+            ranked = [text for text, _ in result["chunks"]]
+            results.append((ranked[0] if ranked else NO_RESULTS_MESSAGE, ranked))
+        return results
+
+    def retrieve_context(self, query, k=5, fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA, where=None, min_score=None):
+        """Retrieves relevant chunks with hybrid dense (MMR) and BM25 search.
+
+        Repeated questions are answered from the query cache without embedding or
+        searching again, until the next ingest changes the index. `where` is a
+        metadata filter pushed down into both searches, e.g.
+        {"source_type": "scenario"} or topic_filter("password"). With
+        `min_score`, e.g. MIN_RELEVANCE_SCORE, chunks that are not similar
+        enough to the query are left out.
+        """
+        return self.retrieve_context_batch([query], k, fetch_k, lambda_mult, where, min_score)[0]
+
+    def retrieve_scored(self, query, k=5, fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA, where=None, min_score=None):
+        """retrieve_context() with similarity scores; see retrieve_scored_batch() for the result."""
+        return self.retrieve_scored_batch([query], k, fetch_k, lambda_mult, where, min_score)[0]
+
+    async def aretrieve_context(self, query, k=5, fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA, where=None, min_score=None):
+        """Awaitable retrieve_context(). Embedding and search run on a worker thread, so the event loop
+        stays free for other I/O, such as talking to Ollama, in the meantime."""
+        return await asyncio.to_thread(self.retrieve_context, query, k, fetch_k, lambda_mult, where, min_score)
+
+    async def aretrieve_scored(self, query, k=5, fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA, where=None, min_score=None):
+        """Awaitable retrieve_scored(), run on a worker thread like aretrieve_context()."""
+        return await asyncio.to_thread(self.retrieve_scored, query, k, fetch_k, lambda_mult, where, min_score)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_rag_service():
+    """Returns the process-wide RAGService, creating it (without loading anything) on first use."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = RAGService()
+        return _service
+
+
+def start_warmup():
+    """Kicks off background warm-up of the shared service and returns it."""
+    service = get_rag_service()
+    service.start_warmup()
+    return service
+
+
+def index_data(file_path):
+    """Indexes a PDF or JSON file into the shared service's vector store."""
+    return get_rag_service().index_data(file_path)
+
+
+def retrieve_context(query, k=5, fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA, where=None, min_score=None):
+    """Retrieves context from the shared service. Never indexes on the request path."""
+    return get_rag_service().retrieve_context(query, k, fetch_k, lambda_mult, where, min_score)
+
+
+async def aretrieve_context(query, k=5, fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA, where=None, min_score=None):
+    """Retrieves context from the shared service without blocking the event loop."""
+    return await get_rag_service().aretrieve_context(query, k, fetch_k, lambda_mult, where, min_score)
+
+
+async def aretrieve_scored(query, k=5, fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA, where=None, min_score=None):
+    """Retrieves scored chunks from the shared service without blocking the event loop."""
+    return await get_rag_service().aretrieve_scored(query, k, fetch_k, lambda_mult, where, min_score)
+
+
+def retrieve_context_batch(queries, k=5, fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA, where=None, min_score=None):
+    """Retrieves context for a list of queries from the shared service, in input order."""
+    return get_rag_service().retrieve_context_batch(queries, k, fetch_k, lambda_mult, where, min_score)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m utilities.rag", description="CyberGuide knowledge base tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Index every PDF and JSON file under a directory")
+    ingest_parser.add_argument("directory", help="Directory to walk for knowledge sources")
+    ingest_parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count)")
+    ingest_parser.add_argument("--pages-per-task", type=int, default=PAGES_PER_TASK, help="PDF pages parsed per task")
+
+    compare_parser = subparsers.add_parser(
+        "compare-backends", help="Compare embedding latency and recall of the embedding backends on the corpus"
+    )
+    compare_parser.add_argument(
+        "--backends", nargs="+", default=available_backends(), choices=EMBEDDING_BACKENDS,
+        help="Backends to compare (default: those whose packages are installed)",
+    )
+    compare_parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    compare_parser.add_argument("-k", type=int, default=5)
+
+    models_parser = subparsers.add_parser(
+        "compare-models", help="Build a second model's index side by side and compare it with the current model"
     )
+    models_parser.add_argument("candidate", help="sentence-transformers model to evaluate, e.g. all-MiniLM-L6-v2")
+    models_parser.add_argument("--baseline", default=EMBEDDING_MODEL_NAME, help="Model to compare against")
+    models_parser.add_argument("--backend", default=EMBEDDING_BACKEND, choices=EMBEDDING_BACKENDS)
+    models_parser.add_argument("-k", type=int, default=5)
+
+    server_parser = subparsers.add_parser(
+        "serve-embeddings", help="Load the embedding model once and serve it to every CyberGuide process on this host"
+    )
+    server_parser.add_argument("--address", default=EMBEDDING_SERVER or DEFAULT_ADDRESS, help="unix:/path.sock or host:port")
+    server_parser.add_argument("--threads", type=int, default=None, help="torch threads per forward pass (default: torch's choice)")
+    server_parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    server_parser.add_argument("--backend", default=EMBEDDING_BACKEND, choices=EMBEDDING_BACKENDS)
+    server_parser.add_argument("--max-wait-ms", type=float, default=QUERY_BATCH_MAX_WAIT_MS, help="How long to collect requests into one batch")
+
+    snapshot_parser = subparsers.add_parser(
+        "snapshot", help="Export the index to a portable snapshot file, or unpack one for a new replica"
+    )
+    snapshot_parser.add_argument("action", choices=["export", "import"])
+    snapshot_parser.add_argument("path", help="Snapshot archive, e.g. cyberguide_index.snapshot")
+
+    benchmark_parser = subparsers.add_parser(
+        "benchmark", help="Measure retrieval recall@k, MRR and latency with the scenarios as ground truth"
+    )
+    benchmark_parser.add_argument("-k", type=int, default=5)
+    benchmark_parser.add_argument("--fetch-k", type=int, default=MMR_FETCH_K)
+    benchmark_parser.add_argument("--lambda-mult", type=float, default=MMR_LAMBDA, help="MMR relevance/diversity trade-off")
+    benchmark_parser.add_argument("--output", default="retrieval_benchmark.json", help="JSON file for the results")
+
+    args = parser.parse_args(argv)
 
-    docs = retriever.invoke(query)
+    if args.command == "ingest":
+        get_rag_service().ingest_directory(args.directory, workers=args.workers, pages_per_task=args.pages_per_task)
 
-    if not docs:
-        return "No relevant cybersecurity information found.", []
+    elif args.command == "compare-backends":
+        from utilities.retrieval.benchmark import compare_embedding_backends, load_scenario_queries, print_rows
 
-    # Rank retrieved documents based on keyword overlap with the query
-    query_words = set(query.lower().split())
-    ranked_docs = sorted(docs, key=lambda doc: len(query_words.intersection(set(doc.page_content.lower().split()))), reverse=True)
+        documents = [
+            chunk.page_content
+            for source in KNOWLEDGE_SOURCES
+            for _, chunk in iter_chunks(source, CHUNK_SIZE, CHUNK_OVERLAP, field_records=SCENARIO_FIELD_RECORDS)
+        ]
+        queries = [item["query"] for item in load_scenario_queries(SCENARIOS_PATH)]
+        print(f" Comparing {args.backends} for {args.model} on {len(documents)} chunks and {len(queries)} queries")
+        print_rows(compare_embedding_backends(args.model, args.backends, documents, queries, k=args.k))
 
-    # Most relevant chunk (top-ranked)
-    most_relevant_chunk = ranked_docs[0].page_content if ranked_docs else "No highly relevant content found."
+    elif args.command == "compare-models":
+        from utilities.retrieval.benchmark import compare_models, load_scenario_queries, print_rows
 
-    # Return both the most relevant chunk and all retrieved docs
-    return most_relevant_chunk, [doc.page_content for doc in ranked_docs]
+        services = [RAGService(model_name=model, backend=args.backend) for model in (args.baseline, args.candidate)]
+        for service in services:
+            print(f" Building {service.collection_name}")
+            service.warm_up()
+        queries = [item["query"] for item in load_scenario_queries(SCENARIOS_PATH)]
+        print_rows(compare_models(services, queries, k=args.k))
 
+    elif args.command == "serve-embeddings":
+        EmbeddingServer(args.model, args.backend, threads=args.threads, max_wait_ms=args.max_wait_ms).serve_forever(args.address)
 
+    elif args.command == "snapshot" and args.action == "export":
+        service = RAGService(snapshot_path=None)
+        service.warm_up()
+        service.export_snapshot(args.path)
 
+    elif args.command == "snapshot":
+        manifest = read_snapshot_manifest(args.path)
+        service = RAGService(model_name=manifest["embedding_model"], backend=manifest["embedding_backend"])
+        started = time.perf_counter()
+        import_snapshot(args.path, service._snapshot_dir())
+        print(f" Verified and unpacked {manifest['count']} chunks to {service._snapshot_dir()} in {time.perf_counter() - started:.1f}s")
+        print(
+            f" Serve it with CYBERGUIDE_SNAPSHOT={args.path} CYBERGUIDE_EMBEDDING_MODEL={manifest['embedding_model']}"
+            f" CYBERGUIDE_EMBEDDING_BACKEND={manifest['embedding_backend']}"
+        )
 
+    elif args.command == "benchmark":
+        from utilities.retrieval.benchmark import print_summary, run_retrieval_benchmark, scenario_cases
 
+        service = get_rag_service()
+        service.warm_up()
+        cases = scenario_cases(SCENARIOS_PATH)
+        results = run_retrieval_benchmark(service, cases, k=args.k, fetch_k=args.fetch_k, lambda_mult=args.lambda_mult)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print_summary(results)
+        print(f" Results written to {args.output}")
 
-# Index the documents
-index_data("./Petra_logistics.pdf")
-index_data("./CybersecurityScenarios.json")
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+benchmark.py - Latency and recall measurements on the CyberGuide corpus
+"""
+
+import json
+import platform
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+from utilities.retrieval.embeddings import create_embeddings
+
+RETRIEVAL_PHASES = ("embed", "search", "lexical", "mmr", "rerank")
+
+
+def load_scenario_queries(path: str) -> List[Dict[str, Any]]:
+    """
+    Builds benchmark queries from CybersecurityScenarios.json.
+
+    Each scenario contributes its title as a query; the scenario it came from is
+    the ground truth the query should retrieve.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        scenarios = json.load(f).get("scenarios", [])
+    return [
+        {"query": scenario["title"], "scenario_id": scenario.get("id"), "title": scenario["title"]}
+        for scenario in scenarios
+        if scenario.get("title")
+    ]
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    return float(np.percentile(values, pct)) if len(values) else 0.0
+
+
+def exact_top_k(matrix: np.ndarray, query_vectors: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k rows of matrix with the highest dot product per query, best first."""
+    scores = query_vectors @ matrix.T
+    k = min(k, matrix.shape[0])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+
+def overlap_recall(results: np.ndarray, reference: np.ndarray) -> float:
+    """Mean fraction of the reference top-k that a result top-k also contains."""
+    k = reference.shape[1]
+    return float(np.mean([len(set(row) & set(ref)) / k for row, ref in zip(results, reference)]))
+
+
+def compare_embedding_backends(
+    model_name: str,
+    backends: Sequence[str],
+    documents: Sequence[str],
+    queries: Sequence[str],
+    k: int = 5,
+) -> List[Dict[str, Any]]:
+    """
+    Embeds the corpus and queries with every backend and compares them to the first one.
+
+    Recall is measured as overlap of each backend's exact top-k with the top-k of
+    the reference backend, so it isolates the effect of the backend on ranking.
+
+    Args:
+        model_name: sentence-transformers model name
+        backends: Backends to compare; the first is the reference
+        documents: Chunk texts of the corpus
+        queries: Query texts
+        k: Neighbours compared per query
+
+    Returns:
+        One result row per backend
+    """
+    rows = []
+    reference_top = None
+    reference_vectors = None
+
+    for backend in backends:
+        embeddings = create_embeddings(model_name, backend)
+        embeddings.embed_query("warm up")
+
+        started = time.perf_counter()
+        doc_vectors = np.asarray(embeddings.embed_documents(list(documents)), dtype=np.float32)
+        doc_seconds = time.perf_counter() - started
+
+        latencies = []
+        query_vectors = []
+        for query in queries:
+            started = time.perf_counter()
+            query_vectors.append(embeddings.embed_query(query))
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        top = exact_top_k(doc_vectors, np.asarray(query_vectors, dtype=np.float32), k)
+        if reference_top is None:
+            reference_top, reference_vectors = top, doc_vectors
+
+        rows.append({
+            "backend": backend,
+            "docs_per_second": len(documents) / doc_seconds if doc_seconds else 0.0,
+            "query_p50_ms": percentile(latencies, 50),
+            "query_p95_ms": percentile(latencies, 95),
+            f"recall@{k}_vs_{backends[0]}": overlap_recall(top, reference_top),
+            "mean_cosine_vs_reference": float(np.mean(np.sum(doc_vectors * reference_vectors, axis=1))),
+        })
+
+    return rows
+
+
+def compare_models(services: Sequence[Any], queries: Sequence[str], k: int = 5) -> List[Dict[str, Any]]:
+    """
+    Measures query latency of ready RAG services and compares their rankings.
+
+    Chunk ids are derived from source and text only, so the same chunk has the
+    same id in every model's namespace; recall@k is the overlap of each
+    service's dense top-k ids with those of the first service.
+
+    Args:
+        services: Warmed-up RAGService instances; the first is the reference
+        queries: Query texts
+        k: Neighbours compared per query
+
+    Returns:
+        One result row per service
+    """
+    rows = []
+    reference_ids = None
+
+    for service in services:
+        service.embedding_model.embed_query("warm up")
+        embed_latencies = []
+        search_latencies = []
+        result_ids = []
+        for query in queries:
+            started = time.perf_counter()
+            embedding = service.embedding_model.embed_query(query)
+            embedded = time.perf_counter()
+            result_ids.append(service.dense_search_ids([embedding], k)[0])
+            searched = time.perf_counter()
+            embed_latencies.append((embedded - started) * 1000)
+            search_latencies.append((searched - embedded) * 1000)
+
+        if reference_ids is None:
+            reference_ids = result_ids
+
+        rows.append({
+            "model": service.model_name,
+            "collection": service.collection_name,
+            "embed_p50_ms": percentile(embed_latencies, 50),
+            "embed_p95_ms": percentile(embed_latencies, 95),
+            "search_p50_ms": percentile(search_latencies, 50),
+            f"recall@{k}_vs_{services[0].model_name}": float(np.mean([
+                len(set(ids) & set(ref)) / k for ids, ref in zip(result_ids, reference_ids)
+            ])),
+        })
+
+    return rows
+
+
+def scenario_cases(scenarios_path: str) -> List[Dict[str, Any]]:
+    """
+    Builds labelled retrieval cases from the scenario file.
+
+    Each scenario yields one case for its title and one per task. The relevant
+    chunks of a case are the stored chunks whose scenario_id metadata is that
+    scenario's id, so a hit means the query found its own scenario.
+
+    Args:
+        scenarios_path: Path of CybersecurityScenarios.json
+
+    Returns:
+        Cases with query, kind ("title" or "task") and scenario_id
+    """
+    with open(scenarios_path, "r", encoding="utf-8") as f:
+        scenarios = json.load(f).get("scenarios", [])
+
+    cases = []
+    for scenario in scenarios:
+        queries = [("title", scenario.get("title", ""))] + [("task", task) for task in scenario.get("tasks", [])]
+        for kind, query in queries:
+            if query:
+                cases.append({"query": query, "kind": kind, "scenario_id": scenario.get("id")})
+    return cases
+
+
+def _summarize(records: List[Dict[str, Any]], k: int) -> Dict[str, Any]:
+    latencies = [record["latency_ms"] for record in records]
+    summary = {
+        "queries": len(records),
+        f"recall@{k}": float(np.mean([record["rank"] is not None for record in records])) if records else 0.0,
+        "mrr": float(np.mean([1.0 / record["rank"] if record["rank"] else 0.0 for record in records])) if records else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": float(np.mean(latencies)) if latencies else 0.0,
+        },
+    }
+    for phase in RETRIEVAL_PHASES:
+        phase_ms = [record["phases_ms"].get(phase, 0.0) for record in records]
+        summary[f"{phase}_ms"] = {"p50": percentile(phase_ms, 50), "mean": float(np.mean(phase_ms)) if phase_ms else 0.0}
+    return summary
+
+
+def run_retrieval_benchmark(
+    service: Any,
+    cases: Sequence[Dict[str, Any]],
+    k: int = 5,
+    fetch_k: int = 20,
+    lambda_mult: float = 0.5,
+) -> Dict[str, Any]:
+    """
+    Runs every case through the service's uncached search, one query at a time.
+
+    Args:
+        service: Warmed-up RAGService
+        cases: Output of scenario_cases()
+        k: Results retrieved per query
+        fetch_k: Dense candidates fetched before MMR
+        lambda_mult: MMR relevance/diversity trade-off
+
+    Returns:
+        JSON-serializable results: run configuration, overall and per-kind
+        summaries (recall@k, MRR, latency percentiles, per-phase time) and the
+        rank of the first relevant chunk for every query
+    """
+    # Start from empty query caches so every case pays for its own embedding
+    service.query_cache.embeddings.clear()
+    service.query_cache.results.clear()
+    service.search(["warm up"], k, fetch_k, lambda_mult)
+
+    records = []
+    relevant_ids: Dict[Any, set] = {}
+    for case in cases:
+        timings: Dict[str, float] = {}
+        started = time.perf_counter()
+        hits = service.search([case["query"]], k, fetch_k, lambda_mult, timings=timings)[0]
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        if case["scenario_id"] not in relevant_ids:
+            relevant_ids[case["scenario_id"]] = set(service.search_backend.ids_matching({"scenario_id": case["scenario_id"]}))
+        relevant = relevant_ids[case["scenario_id"]]
+        rank = next((position for position, (chunk_id, _, _) in enumerate(hits, start=1) if chunk_id in relevant), None)
+        records.append({
+            "query": case["query"],
+            "kind": case["kind"],
+            "scenario_id": case["scenario_id"],
+            "rank": rank,
+            "latency_ms": latency_ms,
+            "phases_ms": {phase: seconds * 1000 for phase, seconds in timings.items()},
+        })
+
+    kinds = sorted({record["kind"] for record in records})
+    return {
+        "config": {
+            "model": service.model_name,
+            "backend": service.backend,
+            "collection": service.collection_name,
+            "vector_backend": service.search_backend.name,
+            "k": k,
+            "fetch_k": fetch_k,
+            "lambda_mult": lambda_mult,
+            "python": platform.python_version(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        },
+        "summary": _summarize(records, k),
+        "by_kind": {kind: _summarize([r for r in records if r["kind"] == kind], k) for kind in kinds},
+        "queries": records,
+    }
+
+
+def print_summary(results: Dict[str, Any]) -> None:
+    """Prints the overall and per-kind summaries of run_retrieval_benchmark() as a table."""
+    rows = []
+    for name, summary in [("all", results["summary"]), *results["by_kind"].items()]:
+        row = {"queries": name, "n": summary["queries"]}
+        row.update({key: value for key, value in summary.items() if isinstance(value, float)})
+        row.update({f"latency_{p}_ms": summary["latency_ms"][p] for p in ("p50", "p95", "p99")})
+        row.update({f"{phase}_mean_ms": summary[f"{phase}_ms"]["mean"] for phase in RETRIEVAL_PHASES})
+        rows.append(row)
+    print_rows(rows)
+
+
+def print_rows(rows: List[Dict[str, Any]]) -> None:
+    """Prints result rows as an aligned table."""
+    if not rows:
+        return
+    columns = list(rows[0])
+    cells = [[f"{row[c]:.3f}" if isinstance(row[c], float) else str(row[c]) for c in columns] for row in rows]
+    widths = [max(len(c), *(len(r[i]) for r in cells)) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for r in cells:
+        print("  ".join(v.ljust(w) for v, w in zip(r, widths)))
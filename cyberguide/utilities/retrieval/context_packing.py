@@ -0,0 +1,139 @@
+"""
+context_packing.py - Fits ranked retrieval chunks into a prompt token budget
+"""
+
+import math
+from typing import Any, Dict, Sequence
+
+# Chunks are split with chunk_overlap=300, so neighbouring chunks share up to that many characters
+MAX_OVERLAP_CHARS = 300
+# Shortest shared text treated as chunk overlap rather than coincidence
+MIN_OVERLAP_CHARS = 40
+# Do not bother appending a truncated tail shorter than this
+MIN_TAIL_TOKENS = 32
+
+DEFAULT_TOKEN_BUDGET = 1024
+# Budgets for models with small context windows, matched by model name prefix
+MODEL_TOKEN_BUDGETS: Dict[str, int] = {
+    "llama3.2:1b": 512,
+    "qwen2.5:0.5b": 512,
+    "gemma2:2b": 768,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximates the token count of text.
+
+    Ollama does not expose its tokenizers over the OpenAI-compatible API; about
+    four characters per token holds well for English with Llama-style BPE vocabularies.
+    """
+    return math.ceil(len(text) / 4)
+
+
+def token_budget_for(model_name: str) -> int:
+    """Returns the context token budget configured for an Ollama model name."""
+    for prefix, budget in MODEL_TOKEN_BUDGETS.items():
+        if model_name and model_name.startswith(prefix):
+            return budget
+    return DEFAULT_TOKEN_BUDGET
+
+
+def _shared_overlap(earlier: str, later: str) -> int:
+    """Length of the longest suffix of `earlier` that is also a prefix of `later`."""
+    if len(later) < MIN_OVERLAP_CHARS:
+        return 0
+    probe = later[:MIN_OVERLAP_CHARS]
+    window_start = max(0, len(earlier) - MAX_OVERLAP_CHARS)
+    position = earlier.find(probe, window_start)
+    while position != -1:
+        tail = earlier[position:]
+        if later.startswith(tail):
+            return len(tail)
+        position = earlier.find(probe, position + 1)
+    return 0
+
+
+def _remove_overlap(text: str, packed: Sequence[str]) -> str:
+    """Trims the parts of text that repeat the start or end of an already packed chunk."""
+    for previous in packed:
+        shared = _shared_overlap(previous, text)
+        if shared:
+            text = text[shared:]
+        shared = _shared_overlap(text, previous)
+        if shared:
+            text = text[:-shared]
+    return text.strip()
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Cuts text to roughly max_tokens, preferring a sentence and then a word boundary."""
+    cut = text[:max_tokens * 4]
+    for boundary in (". ", "\n", " "):
+        position = cut.rfind(boundary)
+        if position > len(cut) // 2:
+            return cut[:position + 1].strip()
+    return cut.strip()
+
+
+def pack_context(chunks: Sequence[str], token_budget: int = DEFAULT_TOKEN_BUDGET, separator: str = "\n\n") -> Dict[str, Any]:
+    """
+    Packs ranked chunks into at most token_budget tokens.
+
+    Chunks are taken best first. Chunks already contained in a packed chunk are
+    dropped, text shared with a packed neighbour (the splitter overlap) is
+    trimmed, and the first chunk that does not fit is truncated to the
+    remaining budget, after which packing stops.
+
+    Args:
+        chunks: Retrieved chunk texts, best first
+        token_budget: Maximum estimated tokens of the packed text
+        separator: Text placed between packed chunks
+
+    Returns:
+        Dictionary with the packed "text", the packed "chunks", "tokens_used",
+        "token_budget", "duplicates_dropped", "overlap_chars_removed" and
+        whether the last chunk was "truncated"
+    """
+    packed = []
+    tokens_used = 0
+    duplicates_dropped = 0
+    overlap_chars_removed = 0
+    truncated = False
+    separator_tokens = estimate_tokens(separator)
+
+    for chunk in chunks:
+        chunk = chunk.strip()
+        if not chunk or any(chunk in previous for previous in packed):
+            duplicates_dropped += 1
+            continue
+
+        trimmed = _remove_overlap(chunk, packed)
+        overlap_chars_removed += len(chunk) - len(trimmed)
+        if not trimmed:
+            duplicates_dropped += 1
+            continue
+
+        joiner_tokens = separator_tokens if packed else 0
+        cost = estimate_tokens(trimmed) + joiner_tokens
+        if cost > token_budget - tokens_used:
+            tail_budget = token_budget - tokens_used - joiner_tokens
+            if tail_budget >= MIN_TAIL_TOKENS:
+                tail = _truncate(trimmed, tail_budget)
+                packed.append(tail)
+                tokens_used += estimate_tokens(tail) + joiner_tokens
+            truncated = True
+            break
+
+        packed.append(trimmed)
+        tokens_used += cost
+
+    return {
+        "text": separator.join(packed),
+        "chunks": packed,
+        "tokens_used": tokens_used,
+        "token_budget": token_budget,
+        "duplicates_dropped": duplicates_dropped,
+        "overlap_chars_removed": overlap_chars_removed,
+        "truncated": truncated,
+    }
@@ -0,0 +1,121 @@
+"""
+dedup.py - Near-duplicate chunk detection with MinHash signatures and LSH banding
+"""
+
+import re
+import zlib
+from typing import Dict, List, Optional
+
+import numpy as np
+
+NUM_PERM = 128
+LSH_BANDS = 16
+SHINGLE_SIZE = 5
+# Estimated Jaccard similarity of character shingles above which a chunk counts as a near-duplicate
+DEFAULT_THRESHOLD = 0.8
+
+# Bumped whenever signatures change, so stored duplicate decisions are recomputed
+MINHASH_VERSION = 2
+
+# Each "permutation" is the splitmix64 finalizer applied to shingle hash ^ seed. Unlike a
+# linear (a * x + b) mod p family over small 32-bit inputs, it scrambles the order of the
+# inputs completely, so every permutation's minimum is an independent, uniform pick.
+_SEEDS = np.random.RandomState(1).randint(0, np.iinfo(np.uint64).max, size=NUM_PERM, dtype=np.uint64)
+_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+
+
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer over uint64 arrays; the multiplications wrap modulo 2^64 on purpose."""
+    with np.errstate(over="ignore"):
+        x = x + _GAMMA
+        x = (x ^ (x >> np.uint64(30))) * _MIX_1
+        x = (x ^ (x >> np.uint64(27))) * _MIX_2
+        return x ^ (x >> np.uint64(31))
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """
+    Hashes the character shingles of text.
+
+    Text is lowercased and whitespace collapsed first, so chunks that only
+    differ in layout produce the same shingles.
+
+    Args:
+        text: Chunk text
+        size: Characters per shingle
+
+    Returns:
+        Unique 32-bit shingle hashes as uint64
+    """
+    normalized = re.sub(r"\s+", " ", text.lower()).strip()
+    if len(normalized) <= size:
+        return np.array([zlib.crc32(normalized.encode("utf-8"))], dtype=np.uint64)
+    hashes = {zlib.crc32(normalized[i:i + size].encode("utf-8")) for i in range(len(normalized) - size + 1)}
+    return np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+
+
+def minhash(text: str) -> np.ndarray:
+    """MinHash signature of a text: the minimum of each of NUM_PERM hash permutations over its shingles."""
+    hashes = shingles(text)
+    return _splitmix64(hashes[:, None] ^ _SEEDS[None, :]).min(axis=0)
+
+
+class NearDuplicateIndex:
+    """
+    Finds chunks whose shingle sets nearly match an already added chunk.
+
+    Signatures are cut into LSH_BANDS bands; chunks sharing any band are
+    candidates, and a candidate only counts when the fraction of equal
+    signature positions (an estimate of Jaccard similarity) reaches the
+    threshold. With 16 bands of 8 rows, pairs above ~0.7 similarity are
+    almost always candidates while unrelated chunks rarely are.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self.rows = NUM_PERM // LSH_BANDS
+        self.buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(LSH_BANDS)]
+        self.signatures: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    def _bands(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(LSH_BANDS)]
+
+    def find(self, signature: np.ndarray) -> Optional[str]:
+        """Returns the id of the most similar added chunk at or above the threshold, or None."""
+        candidates = set()
+        for bucket, band in zip(self.buckets, self._bands(signature)):
+            candidates.update(bucket.get(band, ()))
+
+        best_id, best_similarity = None, self.threshold
+        for chunk_id in candidates:
+            similarity = float(np.mean(self.signatures[chunk_id] == signature))
+            if similarity >= best_similarity:
+                best_id, best_similarity = chunk_id, similarity
+        return best_id
+
+    def add(self, chunk_id: str, signature: np.ndarray) -> None:
+        self.signatures[chunk_id] = signature
+        for bucket, band in zip(self.buckets, self._bands(signature)):
+            bucket.setdefault(band, []).append(chunk_id)
+
+    def canonical(self, chunk_id: str, text: str) -> Optional[str]:
+        """
+        Checks a chunk against the index and adds it if it is not a near-duplicate.
+
+        Args:
+            chunk_id: Id of the chunk
+            text: Chunk text
+
+        Returns:
+            Id of the canonical chunk this one duplicates, or None if it was added as a new canonical chunk
+        """
+        signature = minhash(text)
+        duplicate_of = self.find(signature)
+        if duplicate_of is None:
+            self.add(chunk_id, signature)
+        return duplicate_of
@@ -0,0 +1,169 @@
+"""
+embedding_cache.py - Persistent SQLite cache of chunk embeddings
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_MAX_ENTRIES = 200_000
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Embeddings keyed by (model name, SHA-256 of the text), stored as float32 blobs.
+
+    The cache lives outside the vector store directory so it survives a rebuild
+    of cybersecurity_db and changes to the chunker settings: only text that was
+    never embedded before reaches the model. When the cache grows beyond
+    max_entries, the least recently used rows are evicted.
+    """
+
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        Looks up embeddings for several texts.
+
+        Args:
+            model: Name of the model that produced the embeddings
+            texts: Texts to look up
+
+        Returns:
+            One vector per text, None where the cache has no entry
+        """
+        hashes = [text_hash(text) for text in texts]
+        found: Dict[str, List[float]] = {}
+
+        with self._lock:
+            # Stay well below SQLite's limit on bound parameters
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                for row_hash, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[row_hash] = vector.tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, row_hash) for row_hash in found],
+                )
+                self._conn.commit()
+
+        results = [found.get(h) for h in hashes]
+        hit_count = sum(1 for vector in results if vector is not None)
+        self.hits += hit_count
+        self.misses += len(results) - hit_count
+        return results
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """Stores embeddings and evicts least recently used rows beyond max_entries."""
+        now = time.time()
+        rows = [
+            (model, text_hash(text), array("f", vector).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        excess = self._count() - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+
+    def _count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def reset_counters(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = self._count()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "max_entries": self.max_entries}
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    LangChain embeddings wrapper that serves document embeddings from an EmbeddingCache.
+
+    Only the texts missing from the cache are passed to the wrapped model, in a
+    single embed_documents() call. Queries are passed straight through.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model_name: str):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.cache.get_many(self.model_name, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            computed = self.embeddings.embed_documents(missing_texts)
+            self.cache.put_many(self.model_name, missing_texts, computed)
+            for i, vector in zip(missing, computed):
+                vectors[i] = list(vector)
+
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds several queries in one forward pass, bypassing the cache.
+
+        Sentence-transformers models encode queries and documents the same way,
+        so the batched document path of the wrapped model is used.
+        """
+        return self.embeddings.embed_documents(texts)
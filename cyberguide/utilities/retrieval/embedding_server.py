@@ -0,0 +1,227 @@
+"""
+embedding_server.py - One embedding model per host, served to every process over a local socket
+
+The server loads a model once and answers embed requests from any number of
+Streamlit workers, CLI runs or pages. RemoteEmbeddings is the client side: a
+LangChain Embeddings object that sends texts to the server and falls back to
+loading the model in-process if the server is unreachable or serves another
+model.
+
+Addresses are "unix:/path/to.sock" for a Unix domain socket or "host:port"
+for TCP on localhost. Messages are length-prefixed JSON; vectors travel as
+base64-encoded float32 bytes.
+"""
+
+import base64
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from utilities.retrieval.embeddings import create_embeddings
+from utilities.retrieval.micro_batching import MicroBatcher
+
+DEFAULT_ADDRESS = "unix:/tmp/cyberguide-embeddings.sock"
+CONNECT_TIMEOUT = 2.0
+REQUEST_TIMEOUT = 60.0
+# Largest batch embedded in one forward pass; longer requests are processed in slices
+MAX_BATCH_SIZE = 64
+
+_HEADER = struct.Struct("!I")
+
+
+def parse_address(address: str) -> Tuple[int, Any]:
+    """Returns (socket family, socket address) for "unix:/path" or "host:port"."""
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def send_message(sock: socket.socket, message: Dict[str, Any]) -> None:
+    payload = json.dumps(message).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        block = sock.recv(size - len(data))
+        if not block:
+            raise ConnectionError("Connection closed by peer")
+        data.extend(block)
+    return bytes(data)
+
+
+def recv_message(sock: socket.socket) -> Dict[str, Any]:
+    (size,) = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    return json.loads(_recv_exactly(sock, size))
+
+
+def encode_vectors(vectors: Any) -> Dict[str, Any]:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    return {"shape": list(matrix.shape), "data": base64.b64encode(matrix.tobytes()).decode("ascii")}
+
+
+def decode_vectors(encoded: Dict[str, Any]) -> List[List[float]]:
+    matrix = np.frombuffer(base64.b64decode(encoded["data"]), dtype=np.float32).reshape(encoded["shape"])
+    return matrix.tolist()
+
+
+class EmbeddingServer:
+    """
+    Serves one embedding model to local clients.
+
+    Each connection is handled on its own thread, and all of them feed one
+    MicroBatcher: torch already spreads a single pass over `threads` cores,
+    so requests arriving together share a forward pass instead of competing
+    for those cores.
+    """
+
+    def __init__(self, model_name: str, backend: str = "torch", threads: Optional[int] = None, max_wait_ms: float = 5.0):
+        if threads:
+            import torch
+
+            torch.set_num_threads(threads)
+        self.model_name = model_name
+        self.backend = backend
+        self.threads = threads
+        self.embeddings = create_embeddings(model_name, backend)
+        self.batcher = MicroBatcher(self._embed_batch, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=max_wait_ms)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "backend": self.backend,
+            "threads": self.threads,
+            "pid": os.getpid(),
+            "batching": self.batcher.stats(),
+        }
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        vectors: List[List[float]] = []
+        for start in range(0, len(texts), MAX_BATCH_SIZE):
+            vectors.extend(self.embeddings.embed_documents(texts[start:start + MAX_BATCH_SIZE]))
+        return vectors
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self.batcher.embed(texts)
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get("op")
+        if op == "info":
+            return self.info()
+        if op == "embed":
+            return {"vectors": encode_vectors(self.embed(list(request["texts"])))}
+        return {"error": f"Unknown op {op!r}"}
+
+    def serve_forever(self, address: str = DEFAULT_ADDRESS) -> None:
+        """Listens on address until interrupted."""
+        family, socket_address = parse_address(address)
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                while True:
+                    try:
+                        request = recv_message(self.request)
+                    except (ConnectionError, OSError):
+                        return
+                    try:
+                        response = server.handle(request)
+                    except Exception as e:
+                        response = {"error": str(e)}
+                    send_message(self.request, response)
+
+        if family == socket.AF_UNIX:
+            if os.path.exists(socket_address):
+                os.remove(socket_address)
+            listener = socketserver.ThreadingUnixStreamServer(socket_address, Handler)
+        else:
+            listener = socketserver.ThreadingTCPServer(socket_address, Handler)
+        listener.daemon_threads = True
+
+        print(f" Serving {self.model_name} ({self.backend}, {self.threads or 'default'} torch threads) on {address}")
+        try:
+            listener.serve_forever()
+        finally:
+            listener.server_close()
+            if family == socket.AF_UNIX and os.path.exists(socket_address):
+                os.remove(socket_address)
+
+
+class RemoteEmbeddings(Embeddings):
+    """
+    Embeddings computed by an EmbeddingServer, with an in-process fallback.
+
+    Each thread keeps its own connection. If the server cannot be reached or
+    serves a different model/backend, the model is loaded in this process on
+    first use and used from then on, so callers never see the difference
+    other than in memory use.
+    """
+
+    def __init__(self, address: str, model_name: str, backend: str = "torch"):
+        self.address = address
+        self.model_name = model_name
+        self.backend = backend
+        self._local = threading.local()
+        self._fallback: Optional[Embeddings] = None
+        self._fallback_lock = threading.Lock()
+
+    def _connect(self) -> socket.socket:
+        family, socket_address = parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect(socket_address)
+        sock.settimeout(REQUEST_TIMEOUT)
+
+        send_message(sock, {"op": "info"})
+        info = recv_message(sock)
+        if (info.get("model"), info.get("backend")) != (self.model_name, self.backend):
+            sock.close()
+            raise ConnectionError(f"Embedding server at {self.address} serves {info.get('model')} ({info.get('backend')})")
+        return sock
+
+    def _request(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        # One retry on a fresh connection covers a server restart between requests
+        for attempt in range(2):
+            sock = getattr(self._local, "sock", None)
+            try:
+                if sock is None:
+                    sock = self._local.sock = self._connect()
+                send_message(sock, message)
+                response = recv_message(sock)
+            except (ConnectionError, OSError):
+                if sock is not None:
+                    sock.close()
+                self._local.sock = None
+                if attempt:
+                    raise
+                continue
+            if "error" in response:
+                raise RuntimeError(f"Embedding server error: {response['error']}")
+            return response
+        raise ConnectionError(f"Embedding server at {self.address} is unreachable")
+
+    def _in_process(self) -> Embeddings:
+        with self._fallback_lock:
+            if self._fallback is None:
+                self._fallback = create_embeddings(self.model_name, self.backend)
+            return self._fallback
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self._fallback is None:
+            try:
+                return decode_vectors(self._request({"op": "embed", "texts": list(texts)})["vectors"])
+            except (ConnectionError, OSError) as e:
+                print(f"⚠️ Embedding server unavailable ({e}); loading {self.model_name} in this process")
+        return self._in_process().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
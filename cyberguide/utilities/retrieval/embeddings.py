@@ -0,0 +1,156 @@
+"""
+embeddings.py - Selectable CPU embedding backends for sentence-transformers models
+
+- "torch":      the model as published, float32 PyTorch (LangChain's HuggingFaceEmbeddings)
+- "torch-int8": the same model with its Linear layers dynamically quantized to int8
+- "onnx":       the transformer exported once to ONNX and run with ONNX Runtime
+
+All backends return L2-normalized sentence embeddings, so dot products are
+cosine similarities. The torch backends pool the way the model is configured
+to; the ONNX backend implements mean pooling and refuses other models. Their
+vectors are not numerically identical, so an index must only ever hold
+vectors from one backend.
+"""
+
+import importlib.util
+import json
+import os
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_BACKENDS = ("torch", "torch-int8", "onnx")
+# Packages each backend needs beyond requirements.txt; onnx is an optional extra
+BACKEND_REQUIREMENTS = {
+    "torch": ("torch", "sentence_transformers"),
+    "torch-int8": ("torch", "sentence_transformers"),
+    "onnx": ("onnxruntime", "transformers"),
+}
+# Bumped when the vectors a backend produces change, e.g. when normalization was enforced
+EMBEDDING_SCHEME = 2
+ONNX_MODEL_DIR = "./onnx_models"
+
+
+def available_backends() -> List[str]:
+    """Backends whose packages are installed, checked without importing them."""
+    return [
+        backend for backend in EMBEDDING_BACKENDS
+        if all(importlib.util.find_spec(package) is not None for package in BACKEND_REQUIREMENTS[backend])
+    ]
+
+
+def create_embeddings(model_name: str, backend: str = "torch") -> Embeddings:
+    """
+    Loads a sentence-transformers model with the requested backend.
+
+    Args:
+        model_name: sentence-transformers model name, e.g. "all-mpnet-base-v2"
+        backend: One of EMBEDDING_BACKENDS
+
+    Returns:
+        LangChain embeddings object
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {EMBEDDING_BACKENDS}")
+
+    if backend == "onnx":
+        return OnnxEmbeddings(model_name)
+
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    # Explicit, as models without a Normalize module would otherwise return unnormalized vectors
+    embeddings = HuggingFaceEmbeddings(model_name=model_name, encode_kwargs={"normalize_embeddings": True})
+    if backend == "torch-int8":
+        import torch
+
+        torch.quantization.quantize_dynamic(embeddings.client, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return embeddings
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence embeddings computed with ONNX Runtime on CPU.
+
+    The first use exports the model's transformer to ONNX_MODEL_DIR with torch;
+    after that only onnxruntime and the tokenizer are needed. Pooling is done
+    here (mean over the attention mask, then L2 normalization), matching the
+    Pooling + Normalize modules of models such as all-mpnet-base-v2 and
+    all-MiniLM-L6-v2.
+    """
+
+    def __init__(self, model_name: str, model_dir: str = ONNX_MODEL_DIR, batch_size: int = 32):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        export_dir = os.path.join(model_dir, model_name.replace("/", "__"))
+        model_path = os.path.join(export_dir, "model.onnx")
+        if not os.path.exists(model_path):
+            export_onnx_model(model_name, export_dir)
+
+        with open(os.path.join(export_dir, "export_config.json"), "r", encoding="utf-8") as f:
+            self.max_length = json.load(f)["max_seq_length"]
+        self.tokenizer = AutoTokenizer.from_pretrained(export_dir)
+        self.session = onnxruntime.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        import numpy as np
+
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            tokens = self.tokenizer(
+                texts[start:start + self.batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            mask = tokens["attention_mask"].astype(np.int64)
+            hidden = self.session.run(
+                None, {"input_ids": tokens["input_ids"].astype(np.int64), "attention_mask": mask}
+            )[0]
+            pooled = (hidden * mask[..., None]).sum(axis=1) / np.clip(mask.sum(axis=1, keepdims=True), 1, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            vectors.extend(pooled.astype(np.float32).tolist())
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(list(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0]
+
+
+def export_onnx_model(model_name: str, export_dir: str) -> None:
+    """Exports a sentence-transformers model's transformer and tokenizer to export_dir."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu")
+    pooling = model[1]
+    if not getattr(pooling, "pooling_mode_mean_tokens", False):
+        raise ValueError(f"{model_name} does not use mean pooling, which the ONNX backend implements")
+
+    os.makedirs(export_dir, exist_ok=True)
+    transformer = model[0].auto_model.eval()
+    sample = model.tokenizer(["export sample"], return_tensors="pt")
+    tmp_path = os.path.join(export_dir, "model.onnx.tmp")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            (sample["input_ids"], sample["attention_mask"]),
+            tmp_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=14,
+        )
+    model.tokenizer.save_pretrained(export_dir)
+    with open(os.path.join(export_dir, "export_config.json"), "w", encoding="utf-8") as f:
+        json.dump({"model_name": model_name, "max_seq_length": model.max_seq_length}, f)
+    os.replace(tmp_path, os.path.join(export_dir, "model.onnx"))
@@ -0,0 +1,51 @@
+"""
+intent.py - Cheap local check for small talk that needs no knowledge base lookup
+"""
+
+import re
+
+# A message counts as small talk only if every word is one of these, so any
+# question with actual content ("hi, what is vishing?") still gets retrieval
+SMALL_TALK_WORDS = frozenset("""
+    hi hello hey hiya howdy yo greetings morning afternoon evening night good
+    thanks thank thx ty cheers appreciate appreciated it much very so a lot
+    bye goodbye see ya later cya farewell take care
+    ok okay k kk sure cool nice great awesome perfect alright fine got gotcha understood
+    yes yeah yep no nope nah maybe
+    how are you doing is it going whats up sup hows what's how's
+    who r u your name
+    i im i'm am we me my doing well too and as always lol haha hmm oh wow
+    there all everyone again that the
+""".split())
+
+MAX_SMALL_TALK_WORDS = 8
+
+_WORD = re.compile(r"[a-z']+")
+
+
+def is_small_talk(text: str) -> bool:
+    """
+    Whether a chat message is a greeting, thanks, acknowledgement or goodbye.
+
+    Runs in microseconds and loads nothing. It errs towards retrieval: a
+    message with any word outside SMALL_TALK_WORDS, digits, or more than
+    MAX_SMALL_TALK_WORDS words is treated as a knowledge query.
+
+    Args:
+        text: The user's message
+
+    Returns:
+        True if the message can be answered without retrieved context
+    """
+    lowered = text.lower().strip()
+    if not lowered:
+        return True
+    if any(c.isdigit() for c in lowered):
+        return False
+    words = _WORD.findall(lowered)
+    if not words:
+        # Emoji or punctuation only, e.g. "👍" or "?!"
+        return len(lowered) <= MAX_SMALL_TALK_WORDS
+    if len(words) > MAX_SMALL_TALK_WORDS:
+        return False
+    return all(word in SMALL_TALK_WORDS for word in words)
@@ -0,0 +1,156 @@
+"""
+lexical.py - BM25 inverted index and reciprocal rank fusion for hybrid retrieval
+"""
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Container, Dict, Iterable, List, Optional, Sequence, Tuple
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Words too common to tell chunks apart
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do for from has have how i if in is it its me my no not of on or "
+    "our should so that the their them then there these they this to was we what when where which who "
+    "why will with you your".split()
+)
+
+INDEX_VERSION = 1
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cases text and splits it into alphanumeric tokens without stopwords."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over chunk ids.
+
+    Chunks are tokenized once when they are added. The per-chunk term counts
+    are what gets persisted; the inverted index (term -> chunk -> count) is
+    rebuilt from them on load, so adding and removing chunks stays cheap.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_terms: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.doc_terms)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self.doc_terms
+
+    def add(self, chunk_id: str, text: str) -> None:
+        self._add_terms(chunk_id, dict(Counter(tokenize(text))))
+
+    def _add_terms(self, chunk_id: str, terms: Dict[str, int]) -> None:
+        with self._lock:
+            if chunk_id in self.doc_terms:
+                self._remove_locked(chunk_id)
+            self.doc_terms[chunk_id] = terms
+            length = sum(terms.values())
+            self.doc_lengths[chunk_id] = length
+            self.total_length += length
+            for term, count in terms.items():
+                self.postings.setdefault(term, {})[chunk_id] = count
+
+    def remove(self, chunk_ids: Iterable[str]) -> None:
+        with self._lock:
+            for chunk_id in chunk_ids:
+                if chunk_id in self.doc_terms:
+                    self._remove_locked(chunk_id)
+
+    def _remove_locked(self, chunk_id: str) -> None:
+        for term in self.doc_terms.pop(chunk_id):
+            postings = self.postings[term]
+            del postings[chunk_id]
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(chunk_id)
+
+    def search(self, query: str, top_n: int = 10, allowed: Optional[Container[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Scores chunks against a query.
+
+        Args:
+            query: Free-text query, tokenized here
+            top_n: Number of results to return
+            allowed: If given, only these chunk ids are scored
+
+        Returns:
+            (chunk id, BM25 score) pairs, best first
+        """
+        doc_count = len(self.doc_terms)
+        if not doc_count:
+            return []
+
+        average_length = self.total_length / doc_count
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, count in postings.items():
+                if allowed is not None and chunk_id not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[chunk_id] / average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * count * (self.k1 + 1) / (count + norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_n]
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with self._lock:
+            data = {"version": INDEX_VERSION, "k1": self.k1, "b": self.b, "doc_terms": self.doc_terms}
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Loads a saved index, or returns an empty one if the file is missing or outdated."""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_VERSION:
+            return cls()
+
+        index = cls(k1=data["k1"], b=data["b"])
+        for chunk_id, terms in data["doc_terms"].items():
+            index._add_terms(chunk_id, terms)
+        return index
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[str]:
+    """
+    Fuses several rankings of ids into one.
+
+    Each id scores sum(1 / (k + rank)) over the rankings it appears in; k damps
+    the influence of the very top ranks so that no single ranking dominates.
+
+    Args:
+        rankings: Lists of ids, best first
+        k: RRF damping constant
+
+    Returns:
+        All ids, best fused score first
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda item: scores[item], reverse=True)
@@ -0,0 +1,164 @@
+"""
+manifest.py - Persisted record of which knowledge sources are already indexed
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+MANIFEST_VERSION = 1
+
+
+def hash_file(path: str, block_size: int = 1 << 20) -> str:
+    """
+    Computes the SHA-256 of a file without reading it into memory at once.
+
+    Args:
+        path: File to hash
+        block_size: Bytes read per iteration
+
+    Returns:
+        Hex digest of the file content
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_key(path: str) -> str:
+    """
+    Canonical form of a source path: absolute, normalized and with symlinks resolved.
+
+    Manifest keys, the "source" metadata and chunk ids all derive from it, so
+    "knowledge/a.pdf", "./knowledge/a.pdf" and its absolute path are one source.
+
+    Args:
+        path: Source path as given, relative to the working directory or absolute
+
+    Returns:
+        The canonical path
+    """
+    return os.path.realpath(path)
+
+
+class IngestManifest:
+    """
+    JSON manifest keyed by canonical source path (see source_key()).
+
+    Each entry stores the content hash of the source plus the settings that
+    produced its chunks (chunker parameters and embedding model). A source is
+    only re-ingested when one of those changes. File size and mtime are kept
+    as well so that an untouched file is recognised without re-hashing it.
+
+    A change counter, bumped whenever a source is recorded or removed, tells
+    the service whether the store may hold garbage since the last compaction
+    and whether the last published search index still matches the store, so
+    an unchanged start-up never has to read every id in the collection.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.exists = os.path.exists(path)
+        self._lock = threading.Lock()
+        self.sources: Dict[str, Dict[str, Any]] = {}
+        self.state: Dict[str, Any] = {"changes": 0}
+
+        if self.exists:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.sources = data.get("sources", {})
+                self.state = data.get("state", self.state)
+
+    def get(self, source: str) -> Optional[Dict[str, Any]]:
+        return self.sources.get(source)
+
+    def fingerprint(self, source: str) -> Dict[str, Any]:
+        """
+        Returns size, mtime and content hash for a source file.
+
+        The hash is reused from the manifest when size and mtime are unchanged.
+        """
+        stat = os.stat(source)
+        entry = self.sources.get(source)
+        if entry and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+            content_hash = entry["content_hash"]
+        else:
+            content_hash = hash_file(source)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "content_hash": content_hash}
+
+    def is_current(self, source: str, fingerprint: Dict[str, Any], settings: Dict[str, Any]) -> bool:
+        """
+        Checks whether a source is indexed with the same content and settings.
+
+        Args:
+            source: Source path
+            fingerprint: Result of fingerprint()
+            settings: Chunker parameters and embedding model used for ingestion
+
+        Returns:
+            True if the source can be skipped
+        """
+        entry = self.sources.get(source)
+        return bool(entry) and entry["content_hash"] == fingerprint["content_hash"] and entry["settings"] == settings
+
+    def record(self, source: str, fingerprint: Dict[str, Any], settings: Dict[str, Any], **extra: Any) -> None:
+        """Stores the entry for a freshly ingested source and saves the manifest."""
+        with self._lock:
+            self.sources[source] = dict(fingerprint, settings=settings, **extra)
+            self.state["changes"] += 1
+            self._save()
+
+    def touch(self, source: str, fingerprint: Dict[str, Any]) -> None:
+        """Refreshes size/mtime of an unchanged source so the next check skips hashing."""
+        entry = self.sources.get(source)
+        if entry and (entry.get("size"), entry.get("mtime_ns")) != (fingerprint["size"], fingerprint["mtime_ns"]):
+            with self._lock:
+                entry.update(fingerprint)
+                self._save()
+
+    def remove(self, source: str) -> None:
+        with self._lock:
+            if self.sources.pop(source, None) is not None:
+                self.state["changes"] += 1
+                self._save()
+
+    def mark_changed(self) -> None:
+        """Records a store change no source entry reflects, e.g. chunks written before an ingest failed."""
+        with self._lock:
+            self.state["changes"] += 1
+            self._save()
+
+    def needs_compaction(self) -> bool:
+        """Whether a source was recorded or removed since mark_compacted(); always true for older manifests."""
+        return self.state.get("compacted") != self.state["changes"]
+
+    def mark_compacted(self, store_changed: bool = False) -> None:
+        """Records a compaction; one that deleted chunks counts as a change, so the published index is stale."""
+        with self._lock:
+            if store_changed:
+                self.state["changes"] += 1
+            self.state["compacted"] = self.state["changes"]
+            self._save()
+
+    def published_signature(self) -> Optional[str]:
+        """Ids signature of the search index published for the current state of the store, or None if stale."""
+        published = self.state.get("published") or {}
+        return published.get("signature") if published.get("changes") == self.state["changes"] else None
+
+    def mark_published(self, signature: str) -> None:
+        with self._lock:
+            self.state["published"] = {"changes": self.state["changes"], "signature": signature}
+            self._save()
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "sources": self.sources, "state": self.state}, f, indent=2)
+        os.replace(tmp_path, self.path)
+        self.exists = True
@@ -0,0 +1,128 @@
+"""
+metrics.py - Rolling in-memory histograms with JSON and Prometheus text export
+
+Nothing here runs unless a MetricsRegistry exists: RAGService only creates
+one when metrics are enabled, and every instrumented call site is guarded by
+a single `is not None` check, so disabled metrics cost next to nothing.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class RollingHistogram:
+    """
+    Distribution of the last `window` observations, plus lifetime count and sum.
+
+    Quantiles are computed over the window when a snapshot is taken, so
+    observing is just an append.
+    """
+
+    def __init__(self, window: int = 1024):
+        self.values: deque = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        self.values.append(value)
+        self.count += 1
+        self.total += value
+
+    def snapshot(self) -> Dict[str, float]:
+        values = np.asarray(self.values, dtype=np.float64)
+        summary = {"count": self.count, "sum": self.total, "window": len(values)}
+        for q in QUANTILES:
+            summary[f"p{int(q * 100)}"] = float(np.quantile(values, q)) if len(values) else 0.0
+        summary["max"] = float(values.max()) if len(values) else 0.0
+        return summary
+
+
+class MetricsRegistry:
+    """Named histograms, counters and gauges of one process."""
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self.histograms: Dict[str, RollingHistogram] = {}
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float) -> None:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, RollingHistogram(self.window))
+        histogram.observe(value)
+
+    def increment(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name: str, value: float) -> None:
+        self.gauges[name] = value
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "uptime_seconds": time.time() - self.started,
+            "histograms": {name: histogram.snapshot() for name, histogram in sorted(self.histograms.items())},
+            "counters": dict(sorted(self.counters.items())),
+            "gauges": dict(sorted(self.gauges.items())),
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix: str = "cyberguide_") -> str:
+        """Renders the registry in the Prometheus text exposition format; histograms become summaries."""
+        snapshot = self.snapshot()
+        lines = []
+        for name, summary in snapshot["histograms"].items():
+            metric = _metric_name(prefix, name)
+            lines.append(f"# TYPE {metric} summary")
+            for q in QUANTILES:
+                lines.append(f'{metric}{{quantile="{q}"}} {summary[f"p{int(q * 100)}"]:.6g}')
+            lines.append(f"{metric}_sum {summary['sum']:.6g}")
+            lines.append(f"{metric}_count {summary['count']}")
+        for name, value in snapshot["counters"].items():
+            metric = _metric_name(prefix, name)
+            lines.append(f"# TYPE {metric}_total counter")
+            lines.append(f"{metric}_total {value:.6g}")
+        for name, value in snapshot["gauges"].items():
+            metric = _metric_name(prefix, name)
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value:.6g}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """Writes the registry to path atomically: Prometheus text for *.prom files, JSON otherwise."""
+        content = self.to_prometheus() if path.endswith(".prom") else self.to_json()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(f"{path}.tmp", path)
+
+
+def _metric_name(prefix: str, name: str) -> str:
+    return prefix + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def flatten_gauges(prefix: str, values: Optional[Dict[str, Any]]) -> Dict[str, float]:
+    """Flattens nested numeric stats, e.g. MicroBatcher.stats(), into gauge names joined by "_"."""
+    gauges: Dict[str, float] = {}
+    for key, value in (values or {}).items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            gauges.update(flatten_gauges(name, value))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            gauges[name] = float(value)
+    return gauges
@@ -0,0 +1,127 @@
+"""
+micro_batching.py - Coalesces concurrent embedding requests into shared forward passes
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+EmbedBatch = Callable[[List[str]], List[List[float]]]
+
+
+class MicroBatcher:
+    """
+    Queue in front of an embedding model.
+
+    Callers block in embed() while a single worker thread drains the queue:
+    it takes the oldest request, keeps collecting requests for up to
+    max_wait_ms or until max_batch_size texts are gathered, runs one forward
+    pass over all of them and hands every caller its own slice. Thirty
+    concurrent one-query requests thus cost one batched pass instead of thirty
+    passes competing for torch's thread pool.
+
+    Queue depth, batch size, queue wait and forward pass time are recorded
+    for the most recent `history` batches and reported by stats().
+    """
+
+    def __init__(self, embed_batch: EmbedBatch, max_batch_size: int = 32, max_wait_ms: float = 5.0, history: int = 1024):
+        self.embed_batch = embed_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+        self.max_queue_depth = 0
+        self.batch_sizes: deque = deque(maxlen=history)
+        self.wait_ms: deque = deque(maxlen=history)
+        self.forward_ms: deque = deque(maxlen=history)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embeds texts as part of the next batch; blocks until their vectors are ready."""
+        if not texts:
+            return []
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((list(texts), future, time.perf_counter()))
+        return future.result()
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embedding-micro-batcher", daemon=True)
+                    self._worker.start()
+
+    def _collect(self) -> List[Any]:
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            texts = [text for item_texts, _, _ in batch for text in item_texts]
+            try:
+                vectors = self.embed_batch(texts)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+
+            self.requests += len(batch)
+            self.batches += 1
+            self.texts += len(texts)
+            self.max_queue_depth = max(self.max_queue_depth, len(batch) + self._queue.qsize())
+            self.batch_sizes.append(len(texts))
+            self.forward_ms.append((finished - started) * 1000)
+            self.wait_ms.extend((started - submitted) * 1000 for _, _, submitted in batch)
+
+            offset = 0
+            for item_texts, future, _ in batch:
+                future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters plus percentiles over the recent batches."""
+        def summary(values: deque) -> Dict[str, float]:
+            if not values:
+                return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+            array = np.asarray(values, dtype=np.float64)
+            return {"p50": float(np.percentile(array, 50)), "p95": float(np.percentile(array, 95)), "max": float(array.max())}
+
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "texts": self.texts,
+            "queue_depth": self.queue_depth(),
+            "max_queue_depth": self.max_queue_depth,
+            "mean_batch_size": self.texts / self.batches if self.batches else 0.0,
+            "batch_size": summary(self.batch_sizes),
+            "wait_ms": summary(self.wait_ms),
+            "forward_ms": summary(self.forward_ms),
+        }
@@ -0,0 +1,67 @@
+"""
+mmr.py - Maximal marginal relevance over candidate embeddings in NumPy
+"""
+
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.clip(norms, 1e-12, None)
+
+
+def mmr(
+    query_vector: Sequence[float],
+    candidate_vectors: Sequence[Sequence[float]],
+    k: int,
+    lambda_mult: float = 0.5,
+    query_scores: Optional[Sequence[float]] = None,
+) -> List[int]:
+    """
+    Selects k diverse yet relevant candidates.
+
+    Each step picks the candidate maximising
+    lambda_mult * sim(query, c) - (1 - lambda_mult) * max sim(c, already selected).
+    The candidate-candidate similarities are one matrix product up front, and
+    every step is a vectorized update, so the cost is O(fetch_k^2 * dim) once
+    plus O(k * fetch_k) - small enough to raise fetch_k freely.
+
+    Args:
+        query_vector: Query embedding
+        candidate_vectors: Embeddings of the fetch_k candidates, as returned by the search backend
+        k: Number of candidates to select
+        lambda_mult: 1.0 ranks by relevance only, 0.0 by diversity only
+        query_scores: Cosine similarities of the candidates to the query, if the
+            backend already computed them
+
+    Returns:
+        Indices into candidate_vectors in selection order
+    """
+    candidates = np.asarray(candidate_vectors, dtype=np.float32)
+    k = min(k, len(candidates))
+    if k <= 0:
+        return []
+
+    candidates = _normalize(candidates)
+    if query_scores is None:
+        relevance = candidates @ _normalize(np.asarray(query_vector, dtype=np.float32))
+    else:
+        relevance = np.asarray(query_scores, dtype=np.float32)
+    pairwise = candidates @ candidates.T
+
+    selected = [int(np.argmax(relevance))]
+    max_similarity = pairwise[selected[0]].copy()
+    available = np.ones(len(candidates), dtype=bool)
+    available[selected[0]] = False
+
+    while len(selected) < k:
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, pairwise[best], out=max_similarity)
+
+    return selected
@@ -0,0 +1,276 @@
+"""
+parsing.py - Turns knowledge source files into chunks
+
+Everything here is CPU-bound and free of model or vector store state, so the
+functions can run in worker processes as well as in the Streamlit process.
+"""
+
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import fitz  # PyMuPDF
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+SUPPORTED_EXTENSIONS = (".pdf", ".json")
+
+# (file path, first page, end page) - pages are 0-based, end exclusive; None for whole-file sources
+ParseTask = Tuple[str, Optional[int], Optional[int]]
+# (chunk id, chunk text, chunk metadata)
+ParsedChunk = Tuple[str, str, Dict[str, Any]]
+
+# Scenario fields and their labels, in the order they appear in a scenario's text
+SCENARIO_FIELDS = {
+    "description": "Description",
+    "tasks": "Tasks",
+    "solution": "Solution",
+    "learning_objectives": "Learning Objectives",
+}
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# Topic tags assigned to chunks that mention one of the keywords. Keywords are regular
+# expressions matched as whole words, so e.g. "link" would not match "LinkedIn"; they
+# name the topic itself rather than words like "email" that any scenario may use.
+TOPIC_KEYWORDS = {
+    "phishing": (r"phish\w*", r"smishing", r"spoof\w*", r"(suspicious|unusual|urgent|malicious) links?", r"click a link",
+                 r"qr codes?", r"appears? to (come|be) from", r"(email|text message) asking you to",
+                 r"requesting personal"),
+    "password": (r"passwords?", r"credentials?", r"mfa", r"multi-factor", r"authentication", r"lockout", r"login"),
+    "social_engineering": (r"social engineering", r"phone calls?", r"vishing", r"impersonat\w*", r"linkedin",
+                           r"shoulder surfing", r"overh(ear|eard)", r"conversations?", r"surveys?",
+                           r"(friend|connection) requests?"),
+    "device_security": (r"usb", r"devices?", r"mobile", r"software", r"printers?", r"copiers?", r"workstations?",
+                        r"browser extensions?", r"apps?", r"malware", r"ransomware", r"infect(ed|ion)"),
+    "network": (r"wi-fi", r"vpn", r"routers?", r"video conferences?", r"home network", r"network security"),
+    "data_protection": (r"data", r"documents?", r"disclosures?", r"sharing", r"confidential", r"sensitive",
+                        r"forwarding", r"disposal", r"social media"),
+}
+TOPIC_PATTERNS = {
+    topic: re.compile(r"\b(?:" + "|".join(keywords) + r")\b", re.IGNORECASE) for topic, keywords in TOPIC_KEYWORDS.items()
+}
+
+
+def make_chunk_id(source: str, text: str) -> str:
+    """Stable chunk id derived from the source path and the chunk text."""
+    return hashlib.sha256(f"{source}\x00{text}".encode("utf-8")).hexdigest()[:32]
+
+
+def text_topics(text: str) -> List[str]:
+    """Topic tags of a text: every topic with a keyword that occurs in it as a whole word."""
+    return [topic for topic, pattern in TOPIC_PATTERNS.items() if pattern.search(text)]
+
+
+def scenario_topics(scenario: Dict[str, Any]) -> List[str]:
+    """Topic tags of a scenario, from keywords in its title and description."""
+    return text_topics(f"{scenario.get('title', '')} {scenario.get('description', '')}")
+
+
+def topic_metadata(topics: Sequence[str]) -> Dict[str, Any]:
+    """
+    Metadata for a chunk's topic tags.
+
+    Vector store metadata values must be scalars, so topics are stored both as
+    a comma-separated "topics" string for display and as one topic_<name>
+    flag per known topic for filtering. Every flag is written, False for
+    absent topics, because an upsert may merge metadata into a stored chunk
+    and would otherwise keep a flag the chunk no longer has.
+    """
+    metadata: Dict[str, Any] = {"topics": ",".join(topics)}
+    metadata.update({f"topic_{topic}": topic in topics for topic in TOPIC_KEYWORDS})
+    return metadata
+
+
+def topic_filter(topic: str) -> Dict[str, Any]:
+    """Metadata filter that matches the chunks tagged with a topic, e.g. topic_filter("phishing")."""
+    return {f"topic_{topic}": True}
+
+
+def scenario_metadata(file_path: str, scenario: Dict[str, Any]) -> Dict[str, Any]:
+    """Structured metadata of a scenario's chunks, including its topic tags (see topic_metadata())."""
+    metadata = {
+        "source": file_path,
+        "source_type": "scenario",
+        "scenario_id": scenario.get("id"),
+        "title": scenario.get("title", "No Title"),
+    }
+    metadata.update(topic_metadata(scenario_topics(scenario)))
+    return {key: value for key, value in metadata.items() if value is not None}
+
+
+def pdf_page_count(pdf_path: str) -> int:
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def iter_pdf_pages(pdf_path: str, start_page: int = 0, end_page: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """Yields (page number, text) for pages of a PDF, one page in memory at a time."""
+    with fitz.open(pdf_path) as doc:
+        end_page = doc.page_count if end_page is None else min(end_page, doc.page_count)
+        for page_index in range(start_page, end_page):
+            yield page_index + 1, doc.load_page(page_index).get_text("text")
+
+
+def is_scenario_file(file_path: str) -> bool:
+    """Whether a JSON file holds a "scenarios" list; other JSON files are not knowledge sources."""
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            json_data = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return isinstance(json_data, dict) and isinstance(json_data.get("scenarios"), list)
+
+
+def iter_scenarios(file_path: str) -> Iterator[Dict[str, Any]]:
+    """Yields the scenarios of a scenario JSON file."""
+    with open(file_path, "r", encoding="utf-8") as f:
+        json_data = json.load(f)
+
+    if "scenarios" in json_data and isinstance(json_data["scenarios"], list):
+        yield from json_data["scenarios"]
+
+
+def field_text(scenario: Dict[str, Any], field: str) -> str:
+    """Text of a scenario field; list fields such as tasks are joined into one paragraph."""
+    value = scenario.get(field, "")
+    return " ".join(value) if isinstance(value, list) else str(value)
+
+
+def scenario_text(scenario: Dict[str, Any]) -> str:
+    """The whole scenario as one labelled text."""
+    title = scenario.get("title", "No Title")
+    return "\n\n".join([f"Scenario: {title}"] + [f"{label}: {field_text(scenario, field)}" for field, label in SCENARIO_FIELDS.items()])
+
+
+def split_sentences(text: str, max_chars: int) -> List[str]:
+    """
+    Groups whole sentences into parts of at most max_chars characters.
+
+    Text is only ever cut between sentences; a single sentence longer than
+    max_chars becomes a part of its own.
+    """
+    parts: List[str] = []
+    current = ""
+    for sentence in SENTENCE_END.split(text.strip()):
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            parts.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        parts.append(current)
+    return parts
+
+
+def iter_source_documents(file_path: str, start_page: int = 0, end_page: Optional[int] = None) -> Iterator[Document]:
+    """Parses a PDF page by page, or a scenario JSON file scenario by scenario, into LangChain documents."""
+    if file_path.endswith(".pdf"):
+        for page_number, text in iter_pdf_pages(file_path, start_page, end_page):
+            yield Document(
+                page_content=text,
+                metadata={
+                    "source": file_path,
+                    "source_type": "pdf",
+                    "title": os.path.splitext(os.path.basename(file_path))[0],
+                    "page": page_number,
+                },
+            )
+
+    elif file_path.endswith(".json"):
+        for scenario in iter_scenarios(file_path):
+            yield Document(page_content=scenario_text(scenario), metadata=scenario_metadata(file_path, scenario))
+
+
+def iter_scenario_records(
+    file_path: str,
+    scenario: Dict[str, Any],
+    field_records: Sequence[str],
+    max_chars: int,
+) -> Iterator[Tuple[str, Document]]:
+    """
+    Yields the records of one scenario: the whole scenario, then one record per requested field.
+
+    The scenario record is never split. Field records repeat the scenario
+    title for context, carry the scenario record's id as parent_id, and are
+    only split between sentences if a field is longer than max_chars.
+    """
+    metadata = scenario_metadata(file_path, scenario)
+    text = scenario_text(scenario)
+    scenario_id = make_chunk_id(file_path, text)
+    yield scenario_id, Document(page_content=text, metadata=dict(metadata, record_type="scenario", chunk_index=0))
+
+    title = scenario.get("title", "No Title")
+    for field in field_records:
+        label = SCENARIO_FIELDS[field]
+        for part_index, part in enumerate(split_sentences(field_text(scenario, field), max_chars)):
+            text = f"{title} - {label}: {part}"
+            yield make_chunk_id(file_path, text), Document(
+                page_content=text,
+                metadata=dict(metadata, record_type="field", field=field, parent_id=scenario_id, chunk_index=part_index),
+            )
+
+
+def iter_chunks(
+    file_path: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    start_page: int = 0,
+    end_page: Optional[int] = None,
+    field_records: Sequence[str] = (),
+) -> Iterator[Tuple[str, Document]]:
+    """
+    Yields (chunk id, chunk) pairs for a source.
+
+    PDF pages are split with the character splitter, per page, so chunks never
+    span two pages; chunk_index is the position of the chunk within its page.
+    Each PDF chunk is tagged with the topics its own text mentions.
+    Scenario files are not split at all: see iter_scenario_records().
+    """
+    if file_path.endswith(".json"):
+        for scenario in iter_scenarios(file_path):
+            yield from iter_scenario_records(file_path, scenario, field_records, chunk_size)
+        return
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    for document in iter_source_documents(file_path, start_page, end_page):
+        for chunk_index, chunk in enumerate(text_splitter.split_documents([document])):
+            chunk.metadata["chunk_index"] = chunk_index
+            chunk.metadata.update(topic_metadata(text_topics(chunk.page_content)))
+            yield make_chunk_id(file_path, chunk.page_content), chunk
+
+
+def plan_tasks(file_path: str, pages_per_task: int) -> List[ParseTask]:
+    """Splits a source into independently parseable units: page ranges for PDFs, the whole file otherwise."""
+    if not file_path.endswith(".pdf"):
+        return [(file_path, None, None)]
+    page_count = pdf_page_count(file_path)
+    return [(file_path, start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+
+
+def parse_task(
+    task: ParseTask,
+    chunk_size: int,
+    chunk_overlap: int,
+    field_records: Sequence[str] = (),
+) -> Tuple[int, List[ParsedChunk]]:
+    """
+    Parses and splits one unit of work. Runs in a worker process.
+
+    Args:
+        task: Unit returned by plan_tasks()
+        chunk_size: Splitter chunk size in characters
+        chunk_overlap: Splitter chunk overlap in characters
+        field_records: Scenario fields indexed as their own records
+
+    Returns:
+        Number of PDF pages parsed and the chunks as plain picklable tuples
+    """
+    file_path, start_page, end_page = task
+    chunks = [
+        (chunk_id, chunk.page_content, chunk.metadata)
+        for chunk_id, chunk in iter_chunks(file_path, chunk_size, chunk_overlap, start_page or 0, end_page, field_records)
+    ]
+    pages = (end_page - start_page) if start_page is not None else 0
+    return pages, chunks
@@ -0,0 +1,82 @@
+"""
+query_cache.py - In-process caches for query embeddings and retrieval results
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+def normalize_query(query: str) -> str:
+    """Lower-cases a query and collapses whitespace so trivial variations share a cache entry."""
+    return " ".join(query.lower().split())
+
+
+class LRUCache:
+    """Thread-safe least-recently-used mapping with hit/miss counters."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class QueryCache:
+    """
+    Two-level cache in front of retrieval.
+
+    The first level maps a normalized query to its embedding, the second maps
+    (normalized query, retrieval parameters) to the ranked result. Both levels
+    belong to one index version: as soon as ingestion bumps the version, the
+    next lookup drops everything cached for the old one.
+    """
+
+    def __init__(self, max_embeddings: int = 1024, max_results: int = 512):
+        self.embeddings = LRUCache(max_embeddings)
+        self.results = LRUCache(max_results)
+        self.index_version = None
+        self._lock = threading.Lock()
+
+    def sync(self, index_version: int) -> None:
+        """Clears both levels if the index changed since they were filled."""
+        with self._lock:
+            if index_version != self.index_version:
+                self.embeddings.clear()
+                self.results.clear()
+                self.index_version = index_version
+
+    def stats(self) -> dict:
+        return {
+            "index_version": self.index_version,
+            "embedding_hits": self.embeddings.hits,
+            "embedding_misses": self.embeddings.misses,
+            "embedding_entries": len(self.embeddings),
+            "result_hits": self.results.hits,
+            "result_misses": self.results.misses,
+            "result_entries": len(self.results),
+        }
@@ -0,0 +1,109 @@
+"""
+shared_index.py - Versioned, memory-mapped index files shared by all worker processes on a host
+
+One writer publishes each new state of the index as an immutable version
+directory in the NumpyBackend layout (plus the BM25 term counts), then
+atomically points the CURRENT file at it. Any number of read-only workers
+open the version CURRENT names; because the matrix is memory-mapped, every
+worker reads the same pages from the OS page cache instead of holding its
+own copy. Workers notice a new CURRENT and remap; versions they may still be
+reading are kept until KEEP_VERSIONS newer ones exist.
+"""
+
+import os
+import shutil
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from utilities.retrieval.lexical import BM25Index
+from utilities.retrieval.vector_backends import NumpyBackend, ids_signature
+
+CURRENT_FILE = "CURRENT"
+LEXICAL_FILE = "lexical_index.json"
+KEEP_VERSIONS = 3
+
+
+class SharedIndex:
+    """Publishes and opens versions of an index under one root directory."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def current_version(self) -> Optional[str]:
+        """Name of the published version, or None if nothing was published yet."""
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def current_signature(self) -> Optional[str]:
+        version = self.current_version()
+        return NumpyBackend.stored_signature(os.path.join(self.root, version)) if version else None
+
+    def publish(
+        self,
+        ids: Sequence[str],
+        embeddings: Any,
+        texts: Sequence[str],
+        metadatas: Sequence[Dict[str, Any]],
+        lexical_index: BM25Index,
+        dtype: str = "float32",
+    ) -> str:
+        """
+        Writes a new version and makes it current.
+
+        The version directory is complete before CURRENT is replaced, so readers
+        only ever see finished versions.
+
+        Args:
+            ids: Chunk ids, row order of the matrix
+            embeddings: One vector per id
+            texts: Chunk texts
+            metadatas: Chunk metadata dicts
+            lexical_index: BM25 index over the same chunks
+            dtype: Storage dtype of the matrix
+
+        Returns:
+            Name of the published version
+        """
+        version = f"{time.time_ns():020d}-{ids_signature(ids)[:12]}"
+        directory = os.path.join(self.root, version)
+        NumpyBackend.write(directory, ids, embeddings, texts, metadatas, dtype=dtype)
+        lexical_index.save(os.path.join(directory, LEXICAL_FILE))
+
+        current_path = os.path.join(self.root, CURRENT_FILE)
+        with open(f"{current_path}.tmp", "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(f"{current_path}.tmp", current_path)
+        self.prune()
+        return version
+
+    def open(self) -> Tuple[str, NumpyBackend, BM25Index]:
+        """
+        Opens the current version.
+
+        Returns:
+            (version, memory-mapped vector backend, BM25 index)
+        """
+        for _ in range(3):
+            version = self.current_version()
+            if version is None:
+                raise FileNotFoundError(f"No index has been published to {self.root} yet")
+            directory = os.path.join(self.root, version)
+            try:
+                return version, NumpyBackend(directory), BM25Index.load(os.path.join(directory, LEXICAL_FILE))
+            except FileNotFoundError:
+                # Pruned between reading CURRENT and opening it; CURRENT has moved on
+                continue
+        raise FileNotFoundError(f"The published index in {self.root} kept changing while it was opened")
+
+    def prune(self, keep: int = KEEP_VERSIONS) -> None:
+        """Deletes all but the newest `keep` versions; mappings of deleted files stay valid on POSIX."""
+        current = self.current_version()
+        versions = sorted(
+            name for name in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, name)) and name != current
+        )
+        for name in versions[:max(len(versions) - (keep - 1), 0)]:
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
@@ -0,0 +1,156 @@
+"""
+snapshot.py - Portable single-file index snapshots for fast replica cold starts
+
+A snapshot is an uncompressed tar archive holding:
+
+- snapshot.json:       format version, embedding model/backend, chunk count,
+                       dimensions, ids signature and the SHA-256 of every other member
+- vectors.npy:         float16 embedding matrix, one row per chunk
+- chunks.jsonl:        id, text and metadata of every chunk, in matrix row order
+- lexical_index.json:  the BM25 term counts, so nothing is tokenized on import
+
+Importing unpacks it into the NumpyBackend directory layout, verifying each
+member while it is copied. The matrix is then memory-mapped, so a replica is
+query-ready without a single embedding pass over the corpus.
+"""
+
+import hashlib
+import io
+import json
+import os
+import tarfile
+import tempfile
+import time
+from typing import Any, Dict, Sequence, Tuple
+
+from utilities.retrieval.lexical import BM25Index
+from utilities.retrieval.shared_index import LEXICAL_FILE
+from utilities.retrieval.vector_backends import CHUNKS_FILE, META_FILE, VECTORS_FILE, NumpyBackend, ids_signature
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_MANIFEST = "snapshot.json"
+SNAPSHOT_DTYPE = "float16"
+SNAPSHOT_MEMBERS = (VECTORS_FILE, CHUNKS_FILE, LEXICAL_FILE)
+
+
+def _sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def export_snapshot(
+    path: str,
+    ids: Sequence[str],
+    embeddings: Any,
+    texts: Sequence[str],
+    metadatas: Sequence[Dict[str, Any]],
+    lexical_index: BM25Index,
+    info: Dict[str, Any],
+) -> Dict[str, Any]:
+    """
+    Writes a snapshot archive of an index.
+
+    Args:
+        path: Archive path; written under a temporary name and renamed into place
+        ids: Chunk ids
+        embeddings: One vector per id
+        texts: Chunk texts
+        metadatas: Chunk metadata dicts
+        lexical_index: BM25 index over the same chunks
+        info: Provenance stored in the manifest, e.g. embedding model and backend
+
+    Returns:
+        The snapshot manifest
+    """
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as staging:
+        NumpyBackend.write(staging, ids, embeddings, texts, metadatas, dtype=SNAPSHOT_DTYPE)
+        lexical_index.save(os.path.join(staging, LEXICAL_FILE))
+        with open(os.path.join(staging, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        manifest = dict(
+            info,
+            version=SNAPSHOT_VERSION,
+            created=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            count=meta["count"],
+            dim=meta["dim"],
+            dtype=meta["dtype"],
+            signature=meta["signature"],
+            files={name: _sha256(os.path.join(staging, name)) for name in SNAPSHOT_MEMBERS},
+        )
+        encoded = json.dumps(manifest, indent=2).encode("utf-8")
+
+        tmp_path = f"{path}.tmp"
+        with tarfile.open(tmp_path, "w") as archive:
+            # The manifest goes first so readers can check it before streaming the large members
+            entry = tarfile.TarInfo(SNAPSHOT_MANIFEST)
+            entry.size = len(encoded)
+            entry.mtime = int(time.time())
+            archive.addfile(entry, io.BytesIO(encoded))
+            for name in SNAPSHOT_MEMBERS:
+                archive.add(os.path.join(staging, name), arcname=name)
+        os.replace(tmp_path, path)
+    return manifest
+
+
+def read_snapshot_manifest(path: str) -> Dict[str, Any]:
+    """Reads the manifest of a snapshot archive without touching the other members."""
+    with tarfile.open(path, "r") as archive:
+        manifest = json.load(archive.extractfile(SNAPSHOT_MANIFEST))
+    if manifest.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"{path} is snapshot format {manifest.get('version')}, expected {SNAPSHOT_VERSION}")
+    return manifest
+
+
+def import_snapshot(path: str, directory: str) -> Dict[str, Any]:
+    """
+    Unpacks a snapshot into a NumpyBackend directory.
+
+    Every member is hashed while it is copied and must match the manifest. The
+    meta file, which NumpyBackend reads first, is written last, so a failed or
+    interrupted import never leaves a directory that looks complete. Importing
+    a snapshot whose ids are already in the directory does nothing.
+
+    Args:
+        path: Snapshot archive
+        directory: Target directory, e.g. the NumPy mirror of a collection
+
+    Returns:
+        The snapshot manifest
+    """
+    manifest = read_snapshot_manifest(path)
+    if NumpyBackend.stored_signature(directory) == manifest["signature"] and os.path.exists(os.path.join(directory, LEXICAL_FILE)):
+        return manifest
+
+    os.makedirs(directory, exist_ok=True)
+    meta_path = os.path.join(directory, META_FILE)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    with tarfile.open(path, "r") as archive:
+        for name in SNAPSHOT_MEMBERS:
+            target = os.path.join(directory, name)
+            digest = hashlib.sha256()
+            with archive.extractfile(name) as source, open(f"{target}.tmp", "wb") as f:
+                for block in iter(lambda: source.read(1 << 20), b""):
+                    digest.update(block)
+                    f.write(block)
+            if digest.hexdigest() != manifest["files"][name]:
+                os.remove(f"{target}.tmp")
+                raise ValueError(f"Checksum mismatch for {name} in {path}")
+            os.replace(f"{target}.tmp", target)
+
+    with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({key: manifest[key] for key in ("signature", "count", "dtype", "dim")}, f)
+    os.replace(f"{meta_path}.tmp", meta_path)
+    return manifest
+
+
+def load_snapshot_index(directory: str) -> Tuple[NumpyBackend, BM25Index]:
+    """Opens an imported snapshot: the memory-mapped vector backend and the BM25 index."""
+    backend = NumpyBackend(directory)
+    if ids_signature(backend.ids) != backend.signature:
+        raise ValueError(f"Chunks in {directory} do not match its meta file")
+    return backend, BM25Index.load(os.path.join(directory, LEXICAL_FILE))
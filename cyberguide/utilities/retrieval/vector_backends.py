@@ -0,0 +1,270 @@
+"""
+vector_backends.py - Vector search backends behind RAGService
+
+- ChromaBackend: the persistent Chroma collection (HNSW); the default and the
+  source of truth that ingestion writes to.
+- NumpyBackend:  an exact-search mirror of the collection for small corpora,
+  a contiguous float32/float16 matrix memory-mapped from disk and searched
+  with one matrix multiply and argpartition.
+
+Both return hits as dicts with id, text, metadata, score (cosine similarity,
+higher is better) and embedding, so callers never re-embed candidates.
+
+Searches take an optional `where` filter: a dict of metadata equality
+conditions that all have to hold, e.g. {"source_type": "scenario",
+"topic_phishing": True}. It is applied inside the search, so only the
+matching slice of the index is scored.
+"""
+
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+VECTORS_FILE = "vectors.npy"
+CHUNKS_FILE = "chunks.jsonl"
+META_FILE = "meta.json"
+# Rows scored per matrix product; bounds the float32 copy a float16 matrix needs to this many rows
+SCORE_BLOCK_ROWS = 4096
+
+Hit = Dict[str, Any]
+Where = Optional[Dict[str, Any]]
+
+
+def ids_signature(ids: Iterable[str]) -> str:
+    """Order-independent fingerprint of a set of chunk ids."""
+    digest = hashlib.sha256()
+    for chunk_id in sorted(ids):
+        digest.update(chunk_id.encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def chroma_where(where: Where) -> Where:
+    """Translates an equality filter into Chroma's where syntax."""
+    if not where or len(where) == 1:
+        return where or None
+    return {"$and": [{key: value} for key, value in where.items()]}
+
+
+class ChromaBackend:
+    """Searches a Chroma collection. Embeddings are stored normalized, so L2 distance maps to cosine."""
+
+    name = "chroma"
+
+    def __init__(self, collection: Any):
+        self.collection = collection
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def query(self, embeddings: Sequence[Sequence[float]], n_results: int, where: Where = None) -> List[List[Hit]]:
+        """Top n_results hits per query vector, best first, in one round-trip."""
+        response = self.collection.query(
+            query_embeddings=[list(embedding) for embedding in embeddings],
+            n_results=n_results,
+            where=chroma_where(where),
+            include=["documents", "metadatas", "distances", "embeddings"],
+        )
+        results = []
+        for i in range(len(embeddings)):
+            results.append([
+                {
+                    "id": chunk_id,
+                    "text": response["documents"][i][j],
+                    "metadata": response["metadatas"][i][j] or {},
+                    # Chroma's default space is squared L2; for unit vectors cos = 1 - d / 2
+                    "score": 1.0 - response["distances"][i][j] / 2.0,
+                    "embedding": response["embeddings"][i][j],
+                }
+                for j, chunk_id in enumerate(response["ids"][i])
+            ])
+        return results
+
+    def get_texts(self, ids: Sequence[str]) -> Dict[str, str]:
+        fetched = self.collection.get(ids=list(ids), include=["documents"])
+        return dict(zip(fetched["ids"], fetched["documents"]))
+
+    def ids_matching(self, where: Where) -> List[str]:
+        return self.collection.get(where=chroma_where(where), include=[])["ids"]
+
+    def parent_ids(self, ids: Iterable[str]) -> Dict[str, str]:
+        """Maps the ids of records that stand in for a parent record (scenario fields) to the parent's id."""
+        fetched = self.collection.get(ids=list(ids), include=["metadatas"])
+        return {
+            chunk_id: metadata["parent_id"]
+            for chunk_id, metadata in zip(fetched["ids"], fetched["metadatas"])
+            if metadata and metadata.get("parent_id")
+        }
+
+
+class NumpyBackend:
+    """
+    Exact top-k search over all chunk embeddings held in one matrix.
+
+    The matrix is loaded with np.load(mmap_mode="r"), so it is paged in from
+    disk on demand and shared through the OS page cache. For a few hundred or
+    thousand chunks one matrix-vector product beats an HNSW lookup through
+    SQLite.
+    """
+
+    name = "numpy"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta["count"]:
+            self.vectors = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode="r")
+        else:
+            # A zero-byte array can not be memory-mapped
+            self.vectors = np.zeros((0, 0), dtype=np.float32)
+
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        with open(os.path.join(directory, CHUNKS_FILE), "r", encoding="utf-8") as f:
+            for line in f:
+                chunk = json.loads(line)
+                self.ids.append(chunk["id"])
+                self.texts.append(chunk["text"])
+                self.metadatas.append(chunk["metadata"])
+        self.positions = {chunk_id: i for i, chunk_id in enumerate(self.ids)}
+        # Row indices per filter; the backend is immutable, so they never go stale
+        self._filter_rows: Dict[Any, np.ndarray] = {}
+
+    @property
+    def signature(self) -> str:
+        return self.meta["signature"]
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def rows_matching(self, where: Where) -> Optional[np.ndarray]:
+        """Row indices of the chunks whose metadata matches every condition, or None for no filter."""
+        if not where:
+            return None
+        key = tuple(sorted(where.items()))
+        rows = self._filter_rows.get(key)
+        if rows is None:
+            rows = np.array([
+                i for i, metadata in enumerate(self.metadatas)
+                if all(metadata.get(field) == value for field, value in where.items())
+            ], dtype=np.int64)
+            self._filter_rows[key] = rows
+        return rows
+
+    def ids_matching(self, where: Where) -> List[str]:
+        rows = self.rows_matching(where)
+        return list(self.ids) if rows is None else [self.ids[i] for i in rows]
+
+    def parent_ids(self, ids: Iterable[str]) -> Dict[str, str]:
+        """Maps the ids of records that stand in for a parent record (scenario fields) to the parent's id."""
+        parents = {}
+        for chunk_id in ids:
+            position = self.positions.get(chunk_id)
+            if position is not None and self.metadatas[position].get("parent_id"):
+                parents[chunk_id] = self.metadatas[position]["parent_id"]
+        return parents
+
+    def _scores(self, queries: np.ndarray, rows: Optional[np.ndarray], row_count: int) -> np.ndarray:
+        """
+        Dot products of the queries with all rows, or with the given rows, as float32.
+
+        The matrix is read in blocks of SCORE_BLOCK_ROWS rows. A float32 matrix
+        is multiplied in place through the memory map; a float16 one is cast
+        one block at a time, so a query never copies the whole matrix and the
+        mapped pages stay shared between processes.
+        """
+        scores = np.empty((len(queries), row_count), dtype=np.float32)
+        for start in range(0, row_count, SCORE_BLOCK_ROWS):
+            end = min(start + SCORE_BLOCK_ROWS, row_count)
+            block = self.vectors[start:end] if rows is None else self.vectors[rows[start:end]]
+            scores[:, start:end] = queries @ block.astype(np.float32, copy=False).T
+        return scores
+
+    def query(self, embeddings: Sequence[Sequence[float]], n_results: int, where: Where = None) -> List[List[Hit]]:
+        """Exact top n_results hits per query vector by dot product, best first.
+
+        With a filter only the matching rows are scored.
+        """
+        rows = self.rows_matching(where)
+        row_count = len(self.ids) if rows is None else len(rows)
+        if not row_count:
+            return [[] for _ in embeddings]
+
+        scores = self._scores(np.asarray(embeddings, dtype=np.float32), rows, row_count)
+        n_results = min(n_results, row_count)
+        top = np.argpartition(-scores, n_results - 1, axis=1)[:, :n_results]
+
+        results = []
+        for row_scores, candidates in zip(scores, top):
+            candidates = candidates[np.argsort(-row_scores[candidates])]
+            positions = candidates if rows is None else rows[candidates]
+            results.append([
+                {
+                    "id": self.ids[j],
+                    "text": self.texts[j],
+                    "metadata": self.metadatas[j],
+                    "score": float(score),
+                    "embedding": np.asarray(self.vectors[j], dtype=np.float32),
+                }
+                for j, score in zip(positions, row_scores[candidates])
+            ])
+        return results
+
+    def get_texts(self, ids: Sequence[str]) -> Dict[str, str]:
+        return {chunk_id: self.texts[self.positions[chunk_id]] for chunk_id in ids if chunk_id in self.positions}
+
+    @staticmethod
+    def stored_signature(directory: str) -> Optional[str]:
+        """Signature of the mirror saved in directory, or None if there is none."""
+        try:
+            with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+                return json.load(f).get("signature")
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def write(
+        directory: str,
+        ids: Sequence[str],
+        embeddings: Any,
+        texts: Sequence[str],
+        metadatas: Sequence[Dict[str, Any]],
+        dtype: str = "float32",
+    ) -> None:
+        """
+        Writes a mirror of a collection to directory.
+
+        Each file is written under a temporary name and renamed into place; the
+        meta file, which readers check first, is replaced last.
+
+        Args:
+            directory: Target directory
+            ids: Chunk ids, row order of the matrix
+            embeddings: One vector per id
+            texts: Chunk texts
+            metadatas: Chunk metadata dicts
+            dtype: "float32", or "float16" to halve the size of the matrix
+        """
+        os.makedirs(directory, exist_ok=True)
+        matrix = np.asarray(embeddings, dtype=dtype) if len(ids) else np.zeros((0, 0), dtype=dtype)
+
+        vectors_path = os.path.join(directory, VECTORS_FILE)
+        with open(f"{vectors_path}.tmp", "wb") as f:
+            np.save(f, matrix)
+        os.replace(f"{vectors_path}.tmp", vectors_path)
+
+        chunks_path = os.path.join(directory, CHUNKS_FILE)
+        with open(f"{chunks_path}.tmp", "w", encoding="utf-8") as f:
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                f.write(json.dumps({"id": chunk_id, "text": text, "metadata": metadata or {}}) + "\n")
+        os.replace(f"{chunks_path}.tmp", chunks_path)
+
+        meta_path = os.path.join(directory, META_FILE)
+        with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"signature": ids_signature(ids), "count": len(ids), "dtype": dtype, "dim": int(matrix.shape[1])}, f)
+        os.replace(f"{meta_path}.tmp", meta_path)